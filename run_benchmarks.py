@@ -0,0 +1,269 @@
+"""Benchmarks of the pre-processor, of importing pre-processed modules, of the generated code and of rendering templates.
+
+Usage: python run_benchmarks.py [-n REPEAT] [-k SUBSTRING] [-o OUTPUT]
+
+Results are written as JSON (best time in seconds of REPEAT runs, and some derived numbers),
+so they can be tracked across versions of utf8_interpy and Python."""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import timeit
+
+import utf8_interpy.codec
+# NOTE: we import the codec explicitly, so we can run without installing the utf8_interpy package
+from utf8_interpy import bytecode
+from utf8_interpy import codec
+from utf8_interpy import compat
+from utf8_interpy import preprocessor
+
+root = os.path.dirname(os.path.abspath(__file__))
+
+# Synthetic corpora (bytes strings, without encoding cookie)
+def corpus_small_literals(n=2000):
+    """Many short lines, each with a small interpolated literal."""
+    return b''.join(('x%d = "item #{i} of #{n}: #{names[i]}"\n' % k).encode('ascii') for k in range(n))
+
+def corpus_template(n=5000):
+    """Single huge triple quoted template."""
+    rows = ''.join('<tr><td>#{row%d.name}</td><td>#{row%d.value}</td></tr>\n' % (k, k) for k in range(n))
+    return ('page = """<html>\n<table>\n%s</table>\n</html>"""\n' % rows).encode('ascii')
+
+def corpus_nested(n=1000):
+    """Interpolations with deeply nested brackets and (single quoted) string literals."""
+    line = 'y%d = "#{d[\'a\'][0][\'b\'].upper()} and #{f(g(h(x, y=(1, [2, {3: \'}\'}]))))} #{ {\'k\': (lambda v: v)(1)}[\'k\'] }"\n'
+    return b''.join((line % k).encode('ascii') for k in range(n))
+
+def corpus_plain(n=2000):
+    """No interpolations at all; takes the fast path."""
+    return b''.join(('def f%d(a, b="default"):\n    return a + b  # comment\n\n' % k).encode('ascii') for k in range(n))
+
+def corpus_plain_tagged(n=2000):
+    """No interpolations, but '#{' occurs in comments and single quoted strings, so the file is tokenized."""
+    return b''.join(('def f%d(a, b="default"):\n    return a + \'#{b}\'  # #{comment}\n\n' % k).encode('ascii') for k in range(n))
+
+corpora = [
+    ('small_literals', corpus_small_literals),
+    ('template', corpus_template),
+    ('nested', corpus_nested),
+    ('plain', corpus_plain),
+    ('plain_tagged', corpus_plain_tagged),
+]
+
+def best_of(fun, repeat, number=1):
+    """Best time in seconds of a single call of fun."""
+    return min(timeit.repeat(fun, repeat=repeat, number=number)) / number
+
+def bench_transform(repeat):
+    results = {}
+    for name, corpus in corpora:
+        data = corpus()
+        seconds = best_of(lambda: codec.transform_bytes_string(data), repeat)
+        results['transform.' + name] = {'seconds': seconds, 'bytes': len(data), 'mb_per_s': len(data) / seconds / 1e6}
+
+    # re-transforming a 10k line module after changing a single line, incrementally versus all of it
+    from utf8_interpy import incremental
+    text = corpus_small_literals(10000).decode('ascii')
+    versions = [text, text.replace('x5000 = "item', 'x5000 = "changed item')]
+    source = incremental.IncrementalSource()
+    source.transform(versions[1])
+    edits = iter(versions * (repeat + 1))
+    seconds = best_of(lambda: source.transform(next(edits)), repeat)
+    full_seconds = best_of(lambda: codec.transform_text(versions[0]), repeat)
+    results['transform.incremental_edit'] = {'seconds': seconds, 'full_seconds': full_seconds, 'speedup': full_seconds / seconds}
+    return results
+
+# Cold imports, each in a fresh interpreter
+_import_script = '''
+import sys, time
+sys.path.insert(0, %(path)r)
+import utf8_interpy.bootstrap
+if %(hook)r:
+    import utf8_interpy.importer
+    utf8_interpy.importer.install()
+t0 = time.time()
+import bench_module
+sys.stdout.write(repr(time.time() - t0))
+'''
+
+# names used by the corpora, so the module can be executed
+_import_header = b'''i, n, names, x = 0, 1, ['a'], 1
+d = {'a': [{'b': 'c'}]}
+f = g = h = lambda *args, **kwargs: args
+'''
+
+def _time_import(path, hook, write_bytecode):
+    script = _import_script % {'path': path, 'hook': hook}
+    env = dict(os.environ)
+    env.pop('UTF8_INTERPY_CACHE_DIR', None) # measure the pre-processor, not the disk cache
+    env['PYTHONPATH'] = root
+    args = [sys.executable] + ([] if write_bytecode else ['-B']) + ['-c', script]
+    if write_bytecode:
+        env.pop('PYTHONDONTWRITEBYTECODE', None)
+    return float(subprocess.check_output(args, env=env))
+
+def bench_import(repeat):
+    results = {}
+    data = b'# coding: utf8-interpy\n' + _import_header + corpus_small_literals() + corpus_nested()
+    path = tempfile.mkdtemp()
+    try:
+        source_path = os.path.join(path, 'bench_module.py')
+        with open(source_path, 'wb') as f:
+            f.write(data)
+        variants = [('codec', False)]
+        if sys.version_info >= (3, 4):
+            variants.append(('hook', True))
+        for name, hook in variants:
+            def no_pyc():
+                shutil.rmtree(os.path.join(path, '__pycache__'), ignore_errors=True)
+                for ext in ['c', 'o']:
+                    if os.path.exists(source_path + ext):
+                        os.remove(source_path + ext)
+                return _time_import(path, hook, False)
+            seconds = min(no_pyc() for i in range(repeat))
+            results['import.%s.no_pyc' % name] = {'seconds': seconds, 'bytes': len(data)}
+
+            _time_import(path, hook, True) # writes .pyc
+            if hook or os.path.exists(bytecode.cache_path(source_path)):
+                seconds = min(_time_import(path, hook, True) for i in range(repeat))
+                results['import.%s.pyc' % name] = {'seconds': seconds, 'bytes': len(data)}
+    finally:
+        shutil.rmtree(path)
+    return results
+
+# Generated code versus hand-written equivalents
+_runtime_setup = 'name = "world"; count = 42; ratio = 0.5; items = [1, 2, 3]; from utf8_interpy.template import interpolate'
+_runtime_literals = [
+    ('simple', '"Hello #{name}!"'),
+    ('multiple', '"#{name} has #{count} items: #{items}, first #{items[0]}"'),
+    ('spec', '"ver#{count:03d} ratio=#{ratio:.3f} #{name!r}"'),
+    ('constant', '"#{\'-\' * 40}\\n#{name} has #{1024*1024} bytes"'),
+]
+_runtime_equivalents = {
+    'simple': [('format', '"Hello {}!".format(name)'), ('percent', '"Hello %s!" % (name,)'), ('fstring', 'f"Hello {name}!"')],
+    'multiple': [('format', '"{} has {} items: {}, first {}".format(name, count, items, items[0])'),
+                 ('percent', '"%s has %s items: %s, first %s" % (name, count, items, items[0])'),
+                 ('fstring', 'f"{name} has {count} items: {items}, first {items[0]}"')],
+    'spec': [('nested_percent', preprocessor.interpolate_string('"ver#{\'%03d\' % count} ratio=#{\'%.3f\' % ratio} #{repr(name)}"')),
+             ('nested_format', preprocessor.interpolate_string('"ver#{format(count, \'03d\')} ratio=#{format(ratio, \'.3f\')} #{repr(name)}"')),
+             ('percent', '"ver%03d ratio=%.3f %r" % (count, ratio, name)')],
+    'constant': [('fstring', 'f"{\'-\' * 40}\\n{name} has {1024*1024} bytes"')],
+}
+
+def _concatenation_form(s):
+    quotes, parts = preprocessor.split_string(s)
+    exprs = [preprocessor.tokenize_expression(preprocessor.split_field(parts[i])[0]) for i in range(1, len(parts), 2)]
+    return preprocessor.format_concatenation(preprocessor.concatenation_operands(quotes, parts, exprs))
+
+def bench_runtime(repeat):
+    results = {}
+    number = 100000
+    for name, literal in _runtime_literals:
+        stmts = [('generated', preprocessor.interpolate_string(literal)), ('concatenation', _concatenation_form(literal))]
+        stmts += [(kind, stmt) for kind, stmt in _runtime_equivalents[name] if kind != 'fstring' or compat.has_fstrings]
+        stmts.append(('interpolate', 'interpolate(%r)' % literal[1:-1])) # run-time template, compiled once
+        for kind, stmt in stmts:
+            seconds = min(timeit.repeat(stmt, _runtime_setup, repeat=repeat, number=number)) / number
+            results['runtime.%s.%s' % (name, kind)] = {'seconds': seconds, 'code': stmt}
+
+    # bytes literal, versus interpolating text and encoding it
+    setup = _runtime_setup + '; host = b"example.com"; path = memoryview(b"/index.html"); host_text = "example.com"; path_text = "/index.html"'
+    stmts = [('generated', preprocessor.interpolate_bytes_string('b"GET #{path} HTTP/1.1\\r\\nHost: #{host}\\r\\n\\r\\n"')),
+             ('percent', 'b"GET %b HTTP/1.1\\r\\nHost: %b\\r\\n\\r\\n" % (path, host)'),
+             ('encode', preprocessor.interpolate_string('"GET #{path_text} HTTP/1.1\\r\\nHost: #{host_text}\\r\\n\\r\\n"') + '.encode("utf-8")'),
+             ('decode_encode', preprocessor.interpolate_string('"GET #{bytes(path).decode(\'utf-8\')} HTTP/1.1\\r\\nHost: #{host.decode(\'utf-8\')}\\r\\n\\r\\n"') + '.encode("utf-8")')]
+    for kind, stmt in stmts:
+        seconds = min(timeit.repeat(stmt, setup, repeat=repeat, number=number)) / number
+        results['runtime.bytes.%s' % kind] = {'seconds': seconds, 'code': stmt}
+
+    # debug message with an expensive interpolation, with debug logging disabled
+    setup = _runtime_setup + '; import logging; log = logging.getLogger("bench"); log.setLevel(logging.INFO)'
+    for kind, stmt in [('eager', 'log.debug("items=#{sorted(items * 100)}")'), ('lazy', 'log.debug(L"items=#{sorted(items * 100)}")')]:
+        stmt = compat.untokenize_text(preprocessor.tokenize_and_preprocess_text(stmt + '\n')).strip()
+        seconds = min(timeit.repeat(stmt, setup, repeat=repeat, number=number)) / number
+        results['runtime.debug_disabled.%s' % kind] = {'seconds': seconds, 'code': stmt}
+    return results
+
+# Rendering a template over many records, compared to loops over single interpolations
+_render_template = '#{datdir}/feat/#{feat}_#{ndim[feat]}/#{name}.npy'
+_render_loop = '''
+def loop(rows):
+    result = []
+    for row in rows:
+        feat, name = row['feat'], row['name']
+        result.append(%s)
+    return result
+'''
+
+def bench_render(repeat):
+    from utf8_interpy.template import Template, interpolate, template_source
+    n = 100000
+    namespace = {'datdir': '/data', 'ndim': {'mfcc': 13, 'fbank': 40}}
+    rows = [{'feat': ['mfcc', 'fbank'][k % 2], 'name': 'utt%d' % k} for k in range(n)]
+    columns = {'feat': [row['feat'] for row in rows], 'name': [row['name'] for row in rows]}
+    template = Template(_render_template, namespace)
+
+    def naive(): # merge namespaces for every row
+        result = []
+        for row in rows:
+            ns = dict(namespace)
+            ns.update(row)
+            result.append(interpolate(_render_template, ns))
+        return result
+    def consume(batches): # each batch is a list, like the result of the loops
+        for batch in batches:
+            pass
+    exec(_render_loop % template_source(_render_template), namespace)
+    variants = [
+        ('naive', naive),
+        ('interpolate', lambda: [interpolate(_render_template, namespace, row) for row in rows]),
+        ('loop', lambda: namespace['loop'](rows)), # hand-written loop over generated expression
+        ('render_many', lambda: consume(template.render_many(rows))),
+        ('render_columns', lambda: consume(template.render_columns(columns))),
+    ]
+    results = {}
+    for name, fun in variants:
+        seconds = best_of(fun, repeat)
+        results['render.' + name] = {'seconds': seconds, 'rows': n, 'rows_per_s': n / seconds}
+    return results
+
+benchmarks = [
+    ('transform', bench_transform),
+    ('import', bench_import),
+    ('runtime', bench_runtime),
+    ('render', bench_render),
+]
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Run utf8_interpy benchmarks, output results as JSON.')
+    parser.add_argument('-n', '--repeat', type=int, default=5, help='number of runs per benchmark (best is reported)')
+    parser.add_argument('-k', '--select', default='', help='only run benchmark groups containing this substring (transform, import, runtime, render)')
+    parser.add_argument('-o', '--output', default=None, help='write JSON to this file instead of stdout')
+    args = parser.parse_args(args)
+
+    results = {}
+    for name, bench in benchmarks:
+        if args.select in name:
+            results.update(bench(args.repeat))
+
+    report = {
+        'utf8_interpy': preprocessor.version,
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'repeat': args.repeat,
+        'results': results,
+    }
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+if __name__ == '__main__':
+    main()
@@ -11,10 +11,31 @@ from tests import mixed
 from tests import concatenated
 from tests import continuation
 from tests import escaped
+from tests import nested
+from tests import fstrings
+from tests import optimized
 from tests import docstring
 if sys.version_info.major >= 3:
     from tests import unicode_identifiers
+    from tests import import_hook
 from tests import exceptions
+from tests import disk_cache
+from tests import memory_cache
+from tests import fast_path
+from tests import compile_tree
+from tests import bootstrap
+from tests import streaming
+from tests import instrument
+from tests import batch
+from tests import source_map
+from tests import template
+from tests import memoize
+from tests import lazy
+from tests import format_specs
+from tests import constant_folding
+from tests import incremental
+if sys.version_info.major >= 3:
+    from tests import bytes_literals
 
 
 
@@ -71,9 +92,30 @@ discover_expect_tests_and_add_methods(mixed, Utf8InterpyTestCases)
 discover_expect_tests_and_add_methods(concatenated, Utf8InterpyTestCases)
 discover_expect_tests_and_add_methods(continuation, Utf8InterpyTestCases)
 discover_expect_tests_and_add_methods(escaped, Utf8InterpyTestCases)
+discover_expect_tests_and_add_methods(nested, Utf8InterpyTestCases)
+discover_expect_tests_and_add_methods(fstrings, Utf8InterpyTestCases)
+discover_expect_tests_and_add_methods(optimized, Utf8InterpyTestCases)
 discover_expect_tests_and_add_methods(docstring, Utf8InterpyTestCases)
 if sys.version_info.major >= 3:
     discover_expect_tests_and_add_methods(unicode_identifiers, Utf8InterpyTestCases)
+    discover_expect_tests_and_add_methods(import_hook, Utf8InterpyTestCases)
+discover_expect_tests_and_add_methods(disk_cache, Utf8InterpyTestCases)
+discover_expect_tests_and_add_methods(memory_cache, Utf8InterpyTestCases)
+discover_expect_tests_and_add_methods(fast_path, Utf8InterpyTestCases)
+discover_expect_tests_and_add_methods(compile_tree, Utf8InterpyTestCases)
+discover_expect_tests_and_add_methods(bootstrap, Utf8InterpyTestCases)
+discover_expect_tests_and_add_methods(streaming, Utf8InterpyTestCases)
+discover_expect_tests_and_add_methods(instrument, Utf8InterpyTestCases)
+discover_expect_tests_and_add_methods(batch, Utf8InterpyTestCases)
+discover_expect_tests_and_add_methods(source_map, Utf8InterpyTestCases)
+discover_expect_tests_and_add_methods(template, Utf8InterpyTestCases)
+discover_expect_tests_and_add_methods(memoize, Utf8InterpyTestCases)
+discover_expect_tests_and_add_methods(lazy, Utf8InterpyTestCases)
+discover_expect_tests_and_add_methods(format_specs, Utf8InterpyTestCases)
+discover_expect_tests_and_add_methods(constant_folding, Utf8InterpyTestCases)
+discover_expect_tests_and_add_methods(incremental, Utf8InterpyTestCases)
+if sys.version_info.major >= 3:
+    discover_expect_tests_and_add_methods(bytes_literals, Utf8InterpyTestCases)
 
 
 def create_raises_test_method(fun, raises):
@@ -0,0 +1,38 @@
+"""Testing parallel transformation of many source files."""
+import os
+import shutil
+import tempfile
+import utf8_interpy
+from utf8_interpy import cache
+from utf8_interpy import codec
+
+root = tempfile.mkdtemp()
+try:
+    sources = {}
+    for i in range(5):
+        sources['interpy_%d.py' % i] = ('# coding: utf8-interpy\nvar = %d\nresult = "#{var}bar"\n' % i).encode('ascii')
+    sources['plain.py'] = b'result = "#{var}bar"\n'
+    for name, data in sources.items():
+        with open(os.path.join(root, name), 'wb') as f:
+            f.write(data)
+    missing_path = os.path.join(root, 'missing.py')
+
+    # only files with utf8-interpy cookie are transformed, same as by the codec
+    results = sorted((os.path.basename(path), status, text) for path, status, text, message in utf8_interpy.transform_many([root, missing_path], workers=1))
+    serial_interp = results
+    serial_expect = sorted([(name, 'transformed', codec.transform_source_text(data)) for name, data in sources.items() if name != 'plain.py'] + 
+        [('plain.py', 'skipped', None), ('missing.py', 'error', None)])
+
+    # same results using a pool of worker processes, sharing the persistent cache
+    cache.enable_disk_cache(os.path.join(root, '.cache'))
+    cache.memory_cache.clear()                                  # not inherited by (forked) workers
+    try:
+        batch_workers_interp = sorted((os.path.basename(path), status, text) for path, status, text, message in utf8_interpy.transform_many([root, missing_path], workers=2, chunk_size=2))
+        batch_workers_expect = serial_expect
+
+        disk_cache_interp = len([path for mtime, size, path in cache.disk_cache._entries() if not path.endswith('.map')])
+        disk_cache_expect = 5
+    finally:
+        cache.disable_disk_cache()
+finally:
+    shutil.rmtree(root)
@@ -0,0 +1,35 @@
+"""Testing the lazy codec registration used at start-up (by utf8_interpy.pth)."""
+import os
+import subprocess
+import sys
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def _run(code):
+    # run in a fresh interpreter, so modules imported by other tests don't interfere
+    output = subprocess.check_output([sys.executable, '-c', code], cwd=root)
+    return output.decode('ascii').strip()
+
+# nothing beyond the search function is imported at start-up
+startup_modules_interp = _run(
+    'import sys; import utf8_interpy.bootstrap; '
+    'print([m for m in ("utf8_interpy.codec", "utf8_interpy.preprocessor", "utf8_interpy.cache") if m in sys.modules])')
+startup_modules_expect = '[]'
+
+# codec is imported on first lookup of the encoding
+lookup_interp = _run(
+    'import sys, codecs; import utf8_interpy.bootstrap; '
+    'print(codecs.lookup("utf8-interpy").name, "utf8_interpy.codec" in sys.modules)')
+lookup_expect = 'utf8-interpy True'
+
+# other encodings are not affected
+lookup_other_interp = _run(
+    'import sys, codecs; import utf8_interpy.bootstrap; '
+    'print(codecs.lookup("latin-1").name, "utf8_interpy.codec" in sys.modules)')
+lookup_other_expect = 'iso8859-1 False'
+
+# source using the encoding decodes through the lazily imported codec
+decode_interp = _run(
+    'import utf8_interpy.bootstrap; '
+    'exec(compile(b"# coding: utf8-interpy\\nvar = 1\\nprint(\\"#{var}\\")\\n", "<test>", "exec"))')
+decode_expect = '1'
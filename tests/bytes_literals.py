@@ -0,0 +1,40 @@
+# coding: utf8-interpy
+"""Testing interpolation in double quoted bytes literals."""
+from utf8_interpy import preprocessor
+
+host = b'example.com'
+path = memoryview(b'/index.html')
+body = bytearray(b'{}')
+n = 2
+
+# bytes-like objects are joined as they are
+bytes_basics_interp = b"GET #{path} HTTP/1.1\r\nHost: #{host}\r\n\r\n#{body}"
+bytes_basics_expect = b'GET /index.html HTTP/1.1\r\nHost: example.com\r\n\r\n{}'
+
+bytes_expression_interp = [b"#{host.upper()}!", B"#{b'%d' % n}", b"#{b'-' * n}#{}", b"""a
+#{host[:7]}"""]
+bytes_expression_expect = [b'EXAMPLE.COM!', b'2', b'--', b'a\nexample']
+
+# implicitly concatenated with other literals
+bytes_concatenated_interp = b"#{host}" b"/" b'#{n}' b"#{path}"
+bytes_concatenated_expect = b'example.com/#{n}/index.html'
+
+# single quoted and raw bytes literals are left as is
+bytes_plain_interp = [b'#{host}', br"#{host}", rb"#{host}"]
+bytes_plain_expect = [b'#{host}', b'#{host}', b'#{host}']
+
+# other objects are not converted (like bytes.join())
+def _join_int():
+    try:
+        return b"#{n}"
+    except TypeError:
+        return 'TypeError'
+bytes_join_int_interp = _join_int()
+bytes_join_int_expect = 'TypeError'
+
+# generated code
+generated_bytes_interp = [preprocessor.interpolate_bytes_string('b"pre#{foo}post"'), preprocessor.interpolate_bytes_string('B"#{a, b}"'), preprocessor.interpolate_bytes_string('b"plain"')]
+generated_bytes_expect = ['b"".join([b"pre",foo,b"post"])', 'b"".join([(a, b)])', 'b"plain"']
+
+is_double_quoted_bytes_interp = [preprocessor.is_double_quoted_bytes(s) for s in ['b"x"', 'B"""x"""', "b'x'", 'br"x"', '"x"']]
+is_double_quoted_bytes_expect = [True, True, False, False, False]
@@ -0,0 +1,54 @@
+"""Testing ahead-of-time pre-processing and byte-compilation of source trees."""
+import marshal
+import os
+import shutil
+import tempfile
+from utf8_interpy import bytecode
+from utf8_interpy import compileall
+
+root = tempfile.mkdtemp()
+try:
+    os.makedirs(os.path.join(root, 'pkg'))
+    interpy_path = os.path.join(root, 'pkg', 'interpy_mod.py')
+    plain_path = os.path.join(root, 'pkg', 'plain_mod.py')
+    error_path = os.path.join(root, 'error_mod.py')
+    with open(interpy_path, 'wb') as f:
+        f.write(b'# coding: utf8-interpy\nvar = "foo"\nresult = "#{var}bar"\n')
+    with open(plain_path, 'wb') as f:
+        f.write(b'result = "#{var}bar"\n')
+    with open(error_path, 'wb') as f:
+        f.write(b'# coding: utf8-interpy\nresult = "#{var}bar\n')
+
+    # only files with utf8-interpy cookie are compiled
+    results = sorted((os.path.relpath(path, root), status) for path, status, seconds, message in compileall.compile_tree([root], workers=1))
+    statuses_interp = results
+    statuses_expect = [('error_mod.py', 'error'), (os.path.join('pkg', 'interpy_mod.py'), 'compiled'), (os.path.join('pkg', 'plain_mod.py'), 'skipped')]
+
+    # .pyc is valid for the source, and contains the pre-processed code
+    st = os.stat(interpy_path)
+    pyc_path = bytecode.cache_path(interpy_path)
+    pyc_valid_interp = bytecode.check_pyc(pyc_path, st.st_mtime, st.st_size)
+    pyc_valid_expect = True
+
+    with open(pyc_path, 'rb') as f:
+        f.read(len(bytecode.pyc_header(st.st_mtime, st.st_size)))
+        namespace = {}
+        exec(marshal.loads(f.read()), namespace)
+    pyc_code_interp = namespace['result']
+    pyc_code_expect = 'foobar'
+
+    pyc_plain_interp = os.path.exists(bytecode.cache_path(plain_path))
+    pyc_plain_expect = False
+
+    # second run finds up-to-date .pyc files, unless forced
+    up_to_date_interp = [status for path, status, seconds, message in compileall.compile_tree([interpy_path], workers=1)]
+    up_to_date_expect = ['up-to-date']
+
+    forced_interp = [status for path, status, seconds, message in compileall.compile_tree([interpy_path], workers=1, force=True)]
+    forced_expect = ['compiled']
+
+    # same results using a pool of worker processes
+    workers_interp = sorted(status for path, status, seconds, message in compileall.compile_tree([root], workers=2, force=True))
+    workers_expect = ['compiled', 'error', 'skipped']
+finally:
+    shutil.rmtree(root)
@@ -0,0 +1,45 @@
+# coding: utf8-interpy
+"""Testing evaluation of constant expressions when pre-processing (fold_max_size)."""
+from utf8_interpy import cache
+from utf8_interpy import compat
+from utf8_interpy import preprocessor
+from utf8_interpy.template import template_source
+
+x = 'x'
+
+# same text as when evaluated at run-time
+fold_values_interp = "#{1024*1024} #{'-' * 8} #{(1, 2.5, None)} #{[0]*3} #{-2**10} #{7 // 2}#{True}"
+fold_values_expect = '1048576 -------- (1, 2.5, None) [0, 0, 0] -1024 3True'
+
+fold_specs_interp = "#{1024*1024:,} #{'a'!r} #{3.14159:.2f}"
+fold_specs_expect = "1,048,576 'a' 3.14"
+
+fold_escape_interp = "#{'{\"\\\\}\n'}"
+fold_escape_expect = '{"\\\\}\n'
+
+# generated code
+fold_generated_interp = [preprocessor.interpolate_string(s) for s in ['"#{1024*1024}"', '"#{\'-\' * 3}#{x}"', '"""#{\'a\\nb\'}"""']]
+fold_generated_expect = ['"1048576"', 'f"---{x}"' if compat.has_fstrings else '("---"+%s(x))' % compat.text_type_str, '"""a\\x0ab"""']
+
+fold_template_interp = template_source('#{60*60}s')
+fold_template_expect = '"3600s"'
+
+# anything else is evaluated at run-time
+fold_runtime_interp = [preprocessor.interpolate_string(s) for s in ['"#{x * 3}"', '"#{\'-\' * 1000}"', '"#{9**9**9}"', '"#{1/0}"', '"#{1:>99999999}"', '"#{\'%*d\' % (9, 1)}"', '"#{(1).real}"', '"#{[[[1]*200]*200]*200}"']]
+fold_runtime_expect = [s.replace('"', '"{', 1)[:-1] + '}"' for s in ['f"x * 3"', 'f"\'-\' * 1000"', 'f"9**9**9"', 'f"1/0"', 'f"1:>99999999"', 'f"\'%*d\' % (9, 1)"', 'f"(1).real"', 'f"[[[1]*200]*200]*200"']] if compat.has_fstrings else \
+                      ['(%s(%s))' % (compat.text_type_str, e) for e in ['x * 3', "'-' * 1000", '9**9**9', '1/0']] + \
+                      ['(format(1, ">99999999"))'] + ['(%s(%s))' % (compat.text_type_str, e) for e in ["'%*d' % (9, 1)", '(1).real', '[[[1]*200]*200]*200']]
+
+def _fold_disabled(s):
+    from utf8_interpy import importer
+    digest = cache.source_digest(b'')
+    fold_max_size, preprocessor.fold_max_size = preprocessor.fold_max_size, 0
+    try:
+        # (the option, set after import, is part of cache keys and .pyc tags)
+        return preprocessor.interpolate_string(s), preprocessor.options_tag(), cache.source_digest(b'') != digest, importer.pyc_tag().endswith('-fold-0')
+    finally:
+        preprocessor.fold_max_size = fold_max_size
+
+if compat.has_fstrings:
+    fold_disabled_interp = _fold_disabled('"#{1024*1024}"')
+    fold_disabled_expect = ('f"{1024*1024}"', 'fold-0', True, True)
@@ -0,0 +1,96 @@
+"""Testing the persistent on-disk transform cache."""
+import os
+import shutil
+import tempfile
+import time
+from utf8_interpy import cache
+from utf8_interpy import codec
+
+source = b'# coding: utf8-interpy\nvar = 1\nfoobar = "#{var}"\n'
+
+root = tempfile.mkdtemp()
+try:
+    disk_cache = cache.DiskCache(root, max_size=100)
+
+    # miss, put, hit
+    miss_interp = disk_cache.get('00' * 20)
+    miss_expect = None
+
+    disk_cache.put('01' * 20, b'foobar')
+    hit_interp = disk_cache.get('01' * 20)
+    hit_expect = b'foobar'
+
+    counters_interp = (disk_cache.hits, disk_cache.misses)
+    counters_expect = (1, 1)
+
+    # no temporary files left behind
+    tmp_files_interp = [name for dir, dirs, names in os.walk(root) for name in names if name.startswith('.tmp-')]
+    tmp_files_expect = []
+
+    # least recently used entry is evicted when exceeding max_size
+    disk_cache.put('02' * 20, b'x' * 40)
+    disk_cache.put('03' * 20, b'x' * 40)
+    past = time.time() - 60
+    os.utime(disk_cache._path('01' * 20), (past, past))
+    os.utime(disk_cache._path('02' * 20), (past + 1, past + 1))
+    os.utime(disk_cache._path('03' * 20), (past + 2, past + 2))
+    disk_cache.get('02' * 20)                                       # refreshes '02'
+    disk_cache.put('04' * 20, b'x' * 40)                            # evicts '01' and '03'
+    evict_interp = [disk_cache.get(d * 20) is not None for d in ['01', '02', '03', '04']]
+    evict_expect = [False, True, False, True]
+
+    # entries are only listed on the first put, and once the total size exceeds max_size
+    # (evicting down to max_size * evict_ratio, so not again on the next put)
+    scan_cache = cache.DiskCache(os.path.join(root, 'scan'), max_size=100)
+    scans = []
+    list_entries = scan_cache._entries
+    scan_cache._entries = lambda: scans.append(1) or list_entries()
+    for d in ['01', '02', '03', '04', '05', '06', '07']:
+        scan_cache.put(d * 20, b'x' * 20)                           # lists entries on '01', and on '06' evicting '01' and '02'
+    disk_scans_interp = (len(scans), [scan_cache.get(d * 20) is not None for d in ['01', '02', '03', '04', '05', '06', '07']])
+    disk_scans_expect = (2, [False, False, True, True, True, True, True])
+
+    # the total size is shared by caches with the same root (e.g. in other processes), 
+    # so these don't list the entries on their first put, and evict once the total exceeds max_size
+    shared_root = os.path.join(root, 'shared')
+    shared_caches = [cache.DiskCache(shared_root, max_size=100), cache.DiskCache(shared_root, max_size=100)]
+    scans = []
+    for shared_cache in shared_caches:
+        shared_cache._entries = (lambda list_entries: lambda: scans.append(1) or list_entries())(shared_cache._entries)
+    for i, d in enumerate(['01', '02', '03', '04']):
+        shared_caches[i % 2].put(d * 20, b'x' * 30)                 # lists entries on '01', and on '04' evicting '01'
+    shared_size_interp = (len(scans), [shared_caches[0].get(d * 20) is not None for d in ['01', '02', '03', '04']], shared_caches[1]._total_size())
+    shared_size_expect = (2, [False, True, True, True], 90)
+
+    # entries which aren't valid UTF-8 are dropped
+    cache.enable_disk_cache(os.path.join(root, 'invalid'))
+    try:
+        cache.disk_cache.put('05' * 20, b'\xff')
+        invalid_utf8_interp = (cache.get('05' * 20), cache.disk_cache.get('05' * 20))
+        invalid_utf8_expect = (None, None)
+    finally:
+        cache.disable_disk_cache()
+
+    # codec stores transformed source in the global cache, and reads it back
+    cache.enable_disk_cache(os.path.join(root, 'codec'))
+    try:
+        transformed = codec.transform_source(source)
+        codec_put_interp = cache.disk_cache.get(cache.source_digest(source))
+        codec_put_expect = transformed
+
+        cache.disk_cache.put(cache.source_digest(source), b'cached')
+        cache.memory_cache.clear()                                  # force reading from disk
+        codec_get_interp = codec.transform_source(source)
+        codec_get_expect = b'cached'
+    finally:
+        cache.disable_disk_cache()
+finally:
+    shutil.rmtree(root)
+
+# cache key depends on input bytes
+digest_interp = cache.source_digest(b'foo') == cache.source_digest(b'bar')
+digest_expect = False
+
+# cache key accepts memoryview (as passed to the codec on import)
+digest_memoryview_interp = cache.source_digest(memoryview(b'foo'))
+digest_memoryview_expect = cache.source_digest(b'foo')
@@ -0,0 +1,39 @@
+"""Testing pre-processing is skipped for sources without interpolations."""
+from utf8_interpy import codec
+from utf8_interpy import preprocessor
+
+source_plain  = b'# coding: utf8-interpy\nvar = 1\nfoobar  =  "var"   # odd spacing is preserved\n'
+source_interpolated = b'# coding: utf8-interpy\nvar = 1\nfoobar = "#{var}"\n'
+
+# cheap scan
+scan_plain_interp = preprocessor.may_interpolate(source_plain)
+scan_plain_expect = False
+
+scan_interp_interp = preprocessor.may_interpolate(source_interpolated)
+scan_interp_expect = True
+
+scan_memoryview_interp = preprocessor.may_interpolate(memoryview(source_interpolated))
+scan_memoryview_expect = True
+
+scan_no_quotes_interp = preprocessor.may_interpolate(b"foobar = '#{var}'\n")
+scan_no_quotes_expect = False
+
+scan_lazy_interp = preprocessor.may_interpolate(b'log.debug(L"starting")\n') # (marker is removed)
+scan_lazy_expect = True
+
+# source is passed through unchanged, without running the pre-processor
+stats_before = dict(codec.stats)
+fast_path_interp = codec.transform_source(source_plain)
+fast_path_expect = source_plain
+
+fast_path_string_interp = codec.transform_bytes_string(source_plain)
+fast_path_string_expect = source_plain
+
+fast_path_stats_interp = (codec.stats['fast_path'] - stats_before['fast_path'], codec.stats['preprocessed'] - stats_before['preprocessed'])
+fast_path_stats_expect = (2, 0)
+
+# source with interpolations is pre-processed
+stats_before = dict(codec.stats)
+codec.transform_bytes_string(b'var = 1\nfoobar = "#{var}"\n')
+slow_path_stats_interp = (codec.stats['fast_path'] - stats_before['fast_path'], codec.stats['preprocessed'] - stats_before['preprocessed'])
+slow_path_stats_expect = (0, 1)
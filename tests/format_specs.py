@@ -0,0 +1,49 @@
+# coding: utf8-interpy
+"""Testing conversions and format specs inside #{..} tags, e.g. #{x:.3f} and #{x!r}."""
+from utf8_interpy import compat
+from utf8_interpy import preprocessor
+from utf8_interpy.template import interpolate
+
+x = 3.14159
+name = 'foo'
+width = 6
+d = {'a': 1}
+
+def concatenation(s):
+    quotes, parts = preprocessor.split_string(s)
+    exprs = [preprocessor.tokenize_expression(preprocessor.split_field(parts[i])[0]) for i in range(1, len(parts), 2)]
+    return preprocessor.format_concatenation(preprocessor.concatenation_operands(quotes, parts, exprs))
+
+# interpolated literals
+fspec_float_interp = "x=#{x:.3f}"
+fspec_float_expect = 'x=3.142'
+
+fspec_conversion_interp = "#{name!r} #{name!s} #{name!r:>7}|"
+fspec_conversion_expect = "'foo' foo   'foo'|"
+
+fspec_nested_interp = "[#{x:>{width}.1f}]"
+fspec_nested_expect = '[   3.1]'
+
+# '!=' and ':=', and colons inside brackets and strings are part of the expression
+fspec_expression_interp = "#{x != 1}#{d['a']:02d}#{[0, 1, 2][1:]}#{ {'k': 'v'}['k'] }#{(lambda: 1)()}#{':'}"
+fspec_expression_expect = "True01[1, 2]v1:"
+
+# scanner
+fspec_split_interp = [preprocessor.split_field(field) for field in ['x', 'x:.3f', 'x!r', 'x!r:>10', 'x != y', 'd[1:2]', "f(':')!a", 'x!y', '(y:=1):>3']]
+fspec_split_expect = [('x', ''), ('x', ':.3f'), ('x', '!r'), ('x', '!r:>10'), ('x != y', ''), ('d[1:2]', ''), ("f(':')", '!a'), ('x!y', ''), ('(y:=1)', ':>3')]
+
+# generated code, a single formatting operation per field
+if compat.has_fstrings:
+    fspec_fstring_interp = preprocessor.interpolate_string('"#{x:.3f} #{name!r:>7} #{a.b != c}"')
+    fspec_fstring_expect = 'f"{x:.3f} {name!r:>7} {(a.b != c)}"'
+
+fspec_concatenation_interp = concatenation('"#{x:.3f} #{name!r} #{name!s:>{width}} #{a, b:>9}"')
+fspec_concatenation_expect = ('(format(x, ".3f")+" "+repr(name)+" "+format(%s(name), (">"+%s(width)))+" "+format((a, b), ">9"))' %
+                              (compat.text_type_str, compat.text_type_str))
+
+fspec_evaluate_interp = eval(concatenation('"#{x:.3f} #{name!r:>7} [#{x:>{width}.1f}]"'))
+fspec_evaluate_expect = "3.142   'foo' [   3.1]"
+
+# templates
+fspec_template_interp = interpolate('#{x:.2f}/#{name!r}')
+fspec_template_expect = "3.14/'foo'"
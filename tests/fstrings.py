@@ -0,0 +1,66 @@
+# coding: utf8-interpy
+"""Testing interpolations compiled to f-strings (Py3.6+), and fallback to string concatenation."""
+import sys
+from utf8_interpy import compat
+from utf8_interpy import preprocessor
+
+var = 'foobar'
+x = 1
+y = 2
+
+# braces outside interpolations are kept for str.format()
+braces_interp = "{0} #{var} {{1}}".format('a')
+braces_expect = 'a foobar {1}'
+
+# named unicode escapes keep their braces
+named_escape_interp = "\N{EM DASH}#{var}\N{EM DASH}"
+named_escape_expect = u'\u2014foobar\u2014'
+
+# escaped backslash before N isn't a named unicode escape
+escaped_backslash_interp = "\\N{var}#{var}"
+escaped_backslash_expect = '\\N{var}foobar'
+
+# characters with special meaning in f-strings inside interpolation
+not_equal_interp = "#{x!=y}"
+not_equal_expect = 'True'
+
+dict_interp = "#{ {x: y} }"
+dict_expect = '{1: 2}'
+
+lambda_interp = "#{(lambda: var)()}"
+lambda_expect = 'foobar'
+
+tuple_interp = "#{x, y}"
+tuple_expect = '(1, 2)'
+
+# empty interpolation
+empty_interp = "a#{}b"
+empty_expect = 'ab'
+
+# shadowing 'str' doesn't change interpolation (with f-strings)
+def shadowed_fun():
+    str = lambda value: 'shadowed'
+    return "#{var}"
+if preprocessor.format_fstring('"', ['', 'var', '']) is not None:
+    shadowed_interp = shadowed_fun()
+    shadowed_expect = 'foobar'
+
+# generated code
+if compat.has_fstrings:
+    generated_interp = preprocessor.interpolate_string('"pre#{var}{mid}#{x!=y}#{x:>3}post"')
+    generated_expect = 'f"pre{var}{{mid}}{(x!=y)}{x:>3}post"'
+
+    generated_triple_interp = preprocessor.interpolate_string('"""a\n#{var}"""')
+    generated_triple_expect = 'f"""a\n{var}"""'
+else:
+    generated_interp = preprocessor.interpolate_string('"pre#{var}post"')
+    generated_expect = '("pre"+' + compat.text_type_str + '(var)+"post")'
+
+if sys.version_info < (3, 12):
+    # backslash not allowed inside f-string expression; falls back to concatenation
+    generated_backslash_interp = preprocessor.interpolate_string('"#{len(\'\\n\')}"')
+    generated_backslash_expect = '(' + compat.text_type_str + '(len(\'\\n\')))'
+
+# strings without interpolations are left as is
+generated_plain_interp = preprocessor.interpolate_string('"{var}"')
+generated_plain_expect = '"{var}"'
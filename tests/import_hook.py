@@ -0,0 +1,51 @@
+"""Testing the import hook (Py3 only)."""
+import os
+import shutil
+import sys
+import tempfile
+from utf8_interpy import bytecode
+from utf8_interpy import cache
+from utf8_interpy import codec
+from utf8_interpy import importer
+
+root = tempfile.mkdtemp()
+sys.path.insert(0, root)
+dont_write_bytecode = sys.dont_write_bytecode
+sys.dont_write_bytecode = False # e.g. PYTHONDONTWRITEBYTECODE set
+importer.install()
+try:
+    with open(os.path.join(root, 'interpy_hook_mod.py'), 'wb') as f:
+        f.write(b'# coding: utf8-interpy\nvar = "foo"\nresult = "#{var}bar"\n')
+    with open(os.path.join(root, 'plain_hook_mod.py'), 'wb') as f:
+        f.write(b'result = "#{var}bar"\n')
+
+    import interpy_hook_mod
+    import plain_hook_mod
+
+    hook_result_interp = interpy_hook_mod.result
+    hook_result_expect = 'foobar'
+
+    hook_loader_interp = type(interpy_hook_mod.__loader__)
+    hook_loader_expect = importer.InterpyLoader
+
+    hook_plain_loader_interp = type(plain_hook_mod.__loader__) is importer.InterpyLoader
+    hook_plain_loader_expect = False
+
+    # code is cached in .pyc tagged with pre-processor version
+    hook_pyc_interp = os.path.exists(bytecode.cache_path(interpy_hook_mod.__file__, importer.pyc_tag()))
+    hook_pyc_expect = True
+
+    # re-importing uses cached code, without pre-processing
+    del sys.modules['interpy_hook_mod']
+    cache.memory_cache.clear()
+    stats_before = dict(codec.stats)
+    import interpy_hook_mod
+    hook_reimport_interp = (interpy_hook_mod.result, codec.stats['preprocessed'] - stats_before['preprocessed'])
+    hook_reimport_expect = ('foobar', 0)
+finally:
+    importer.uninstall()
+    sys.dont_write_bytecode = dont_write_bytecode
+    sys.path.remove(root)
+    sys.modules.pop('interpy_hook_mod', None)
+    sys.modules.pop('plain_hook_mod', None)
+    shutil.rmtree(root)
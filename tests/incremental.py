@@ -0,0 +1,81 @@
+"""Testing incremental re-transforming of changed sources (see utf8_interpy.incremental)."""
+import contextlib
+import io
+import os
+import tempfile
+from utf8_interpy import codec
+from utf8_interpy import incremental
+
+def _functions(n):
+    return ''.join('def f%d(a, b="x"):\n    """doc #{a}"""\n    s = ("#{a[0]}"\n         "#{b}")\n    if a:\n        return """multi\n#{a} line"""\n    return "#{a} #{b!r}"\n\n' % k for k in range(n))
+
+source = _functions(20)
+edits = [
+    lambda s: s.replace('"#{a} #{b!r}"', '"#{b} changed"', 1),                       # single line
+    lambda s: s.replace('    if a:\n', '    if a:\n        x = "#{a}"\n', 1),            # inserted statement
+    lambda s: s.replace('    if a:\n', '    if 1:\n      if a:\n', 1),                  # indentation levels change
+    lambda s: s.replace('def f3(', 'x = """#{a}\ndef f3(', 1),                        # unterminated string (invalid)
+    lambda s: s.replace('x = """#{a}\ndef f3(', 'x = """#{a}"""\ndef f3(', 1),        # fixed again
+    lambda s: s.replace('    s = ("#{a[0]}"\n', '    s = ("#{a[1]}",\n', 1),            # continued statement
+    lambda s: s[s.index('def f1('):],                                                 # deleted at start
+    lambda s: 'import os\n' + s + 'y = "#{os.sep}"',                                  # added at start and end (without newline)
+    lambda s: s.replace('"#{b}")', '"#{b}"))', 1),                                     # unmatched bracket (invalid)
+    lambda s: s.replace('"#{b}"))', '"#{b}")', 1),
+    lambda s: '',
+]
+
+def _transform_edits(source, edits):
+    # same result as a full transform after each edit
+    results = []
+    transformer = incremental.IncrementalSource()
+    with contextlib.redirect_stdout(io.StringIO()): # (warnings about invalid sources)
+        for edit in [lambda s: s] + edits:
+            source = edit(source)
+            results.append(transformer.transform(source) == codec.transform_text(source))
+    return results
+
+incr_edits_interp = _transform_edits(source, edits)
+incr_edits_expect = [True] * (len(edits) + 1)
+
+# only the changed statements are transformed again
+def _lines_transformed(source, edit):
+    transformer = incremental.IncrementalSource()
+    transformer.transform(source)
+    before = dict(incremental.stats)
+    transformer.transform(edit(source))
+    return incremental.stats['full'] - before['full'], incremental.stats['lines_transformed'] - before['lines_transformed']
+
+incr_lines_interp = [_lines_transformed(source, edit) for edit in edits[:3]]
+incr_lines_expect = [(0, 1), (0, 3), (0, 5)] # (up to the next statement at the same indentation levels)
+
+# verify option compares with a full transform
+def _verified(source, edits):
+    verify, incremental.verify = incremental.verify, True
+    mismatches = incremental.stats['mismatches']
+    try:
+        _transform_edits(source, edits)
+    finally:
+        incremental.verify = verify
+    return incremental.stats['mismatches'] - mismatches
+
+incr_verified_interp = _verified(source, edits)
+incr_verified_expect = 0
+
+# files, by path
+def _transform_file_edits(source, edits):
+    fd, path = tempfile.mkstemp(suffix='.py')
+    os.close(fd)
+    results = []
+    try:
+        for edit in [lambda s: s] + edits[:3]:
+            source = edit(source)
+            with open(path, 'wb') as f:
+                f.write(('# coding: utf8-interpy\n' + source).encode('utf-8'))
+            results.append(incremental.transform_file(path) == codec.transform_source_text(('# coding: utf8-interpy\n' + source).encode('utf-8')))
+    finally:
+        incremental.forget(path)
+        os.remove(path)
+    return results
+
+incr_file_interp = _transform_file_edits(source, edits)
+incr_file_expect = [True] * 4
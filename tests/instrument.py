@@ -0,0 +1,56 @@
+"""Testing instrumentation of pre-processing."""
+import codecs
+from utf8_interpy import cache
+from utf8_interpy import codec
+from utf8_interpy import instrument
+
+source = b'# coding: utf8-interpy\nvar = 1\nfoo = "#{var}"\nbar = "#{var} #{var}"\nbaz = "plain"\n'
+
+collected = []
+cache.memory_cache.clear()
+instrument.reset()
+instrument.enable(summary=False)
+instrument.add_callback(collected.append)
+try:
+    codec.transform_source(source)
+    codec.transform_source(source)                  # cached
+    codec.transform_source(b'var = 1\n')            # fast path
+finally:
+    instrument.remove_callback(collected.append)
+    instrument.disable()
+codec.transform_source(b'foo = "#{1}"\n')           # not recorded when disabled
+
+record_interp = dict((key, collected[0][key]) for key in ['bytes_in', 'literals', 'cache_hit', 'fast_path'])
+record_expect = {'bytes_in': len(source), 'literals': 2, 'cache_hit': False, 'fast_path': False}
+
+record_tokens_interp = collected[0]['tokens'] > 0 and collected[0]['bytes_out'] > 0
+record_tokens_expect = True
+
+record_cached_interp = [(r['cache_hit'], r['fast_path']) for r in collected]
+record_cached_expect = [(False, False), (True, False), (False, True)]
+
+totals_interp = (instrument.totals['sources'], instrument.totals['literals'], instrument.totals['cache_hits'], instrument.totals['fast_path'])
+totals_expect = (3, 2, 1, 1)
+
+class _Output(list):
+    write = list.append
+summary = _Output()
+instrument.summary(summary)
+summary_interp = ''.join(summary).startswith('utf8_interpy: 3 sources (1 cache hits, 1 fast path)')
+summary_expect = True
+instrument.reset()
+
+# incremental decoding (e.g. by linecache) is recorded once per source as well
+streamed = []
+cache.memory_cache.clear()
+instrument.enable(summary=False)
+instrument.add_callback(streamed.append)
+try:
+    decoder = codecs.getincrementaldecoder('utf8-interpy')()
+    text = u''.join(decoder.decode(source[i:i+16]) for i in range(0, len(source), 16)) + decoder.decode(b'', final=True)
+finally:
+    instrument.remove_callback(streamed.append)
+    instrument.disable()
+record_streamed_interp = [(r['bytes_in'], r['bytes_out'], r['literals'], r['cache_hit'], r['fast_path']) for r in streamed]
+record_streamed_expect = [(len(source), len(text.encode('utf-8')), 2, False, False)]
+instrument.reset()
@@ -0,0 +1,102 @@
+# coding: utf8-interpy
+"""Testing lazy string literals (L"..."), which are only interpolated when needed."""
+import logging
+import os
+import subprocess
+import sys
+from utf8_interpy import codec
+from utf8_interpy import runtime
+
+calls = []
+def expensive(value):
+    calls.append(value)
+    return value
+
+# nothing is evaluated until converted to str, and then only once
+def _render_once():
+    del calls[:]
+    text = L"state=#{expensive(1)}"
+    before = len(calls)
+    return type(text).__name__, before, str(text), str(text), len(calls)
+render_once_interp = _render_once()
+render_once_expect = ('LazyString', 0, 'state=1', 'state=1', 1)
+
+# messages of disabled log levels are never interpolated
+class _ListHandler(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.messages = []
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+def _logging():
+    del calls[:]
+    log = logging.getLogger('tests.lazy')
+    log.propagate = False
+    handler = _ListHandler()
+    log.addHandler(handler)
+    log.setLevel(logging.INFO)
+    try:
+        log.debug(L"debug #{expensive(2)}")
+        log.info(L"info #{expensive(3)} %s", 'arg')
+    finally:
+        log.removeHandler(handler)
+    return handler.messages, calls
+logging_interp = _logging()
+logging_expect = (['info 3 arg'], [3])
+
+# behaves like the text otherwise
+name = 'world'
+text_interp = [L"a#{name}" + 'b', 'b' + L"a#{name}", L"a#{name}" == 'aworld', len(L"a#{name}"), L"a#{name}".upper(), '%s|%6s' % (L"a#{name}", L"#{1}"), repr(L"#{name}")]
+text_expect = ['aworldb', 'baworld', True, 6, 'AWORLD', 'aworld|     1', "'world'"]
+
+text_sequence_interp = ['w' in L"a#{name}", list(L"#{name}"[:2]), L"#{name}"[-1], L"a#{name}" < 'b', 'b' >= L"a#{name}", L"#{1}" * 3, 2 * L"#{1}", sorted([L"#{name}", 'abc'])]
+text_sequence_expect = [True, ['w', 'o'], 'd', True, True, '111', '11', ['abc', 'world']]
+
+# implicitly concatenated with other literals, and without interpolations
+concatenated_interp = [L"a#{name}" "b" "#{1}", L"plain", type(L"plain").__name__]
+concatenated_expect = ['aworldb1', 'plain', 'str']
+
+# a lazy literal makes its whole group of implicitly concatenated literals lazy
+def _concatenated_lazy():
+    rendered = []
+    def expensive(value):
+        rendered.append(value)
+        return value
+    texts = [L"state=#{expensive(4)}" " suffix", "state " L"#{expensive(5)}" "#{expensive(6)}"]
+    before = list(rendered)
+    return [type(text).__name__ for text in texts], before, [str(text) for text in texts], rendered
+concatenated_lazy_interp = _concatenated_lazy()
+concatenated_lazy_expect = (['LazyString', 'LazyString'], [], ['state=4 suffix', 'state 56'], [4, 5, 6])
+
+# also in sources without any interpolations
+plain_source_interp = codec.transform_source(b'# coding: utf8-interpy\nlog.debug(L"starting")\n')
+plain_source_expect = b'# coding: utf8-interpy\nlog.debug("starting")\n'
+
+# values of variables at the time of rendering are used
+def _late():
+    value = 1
+    text = L"#{value}"
+    value = 2
+    return str(text)
+late_interp = _late()
+late_expect = '2'
+
+# 'L' not directly followed by a string is just a name
+def L(value):
+    return 'L(' + value + ')'
+name_interp = [L("#{name}"), L ("#{name}")]
+name_expect = ['L(world)', 'L(world)']
+
+runtime_interp = str(runtime.LazyString(lambda: 'x'))
+runtime_expect = 'x'
+
+# generated code imports run-time support on first use
+def _fresh():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    code = ('import sys; import utf8_interpy.bootstrap; before = "utf8_interpy.runtime" in sys.modules; '
+            'exec(compile(b"# coding: utf8-interpy\\nx = 1\\ntext = L\\"#{x}\\"\\n", "<test>", "exec")); '
+            'print(before, "utf8_interpy.runtime" in sys.modules, text)')
+    return subprocess.check_output([sys.executable, '-c', code], cwd=root).decode('ascii').split()
+fresh_interp = _fresh()
+fresh_expect = ['False', 'True', '1']
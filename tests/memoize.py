@@ -0,0 +1,85 @@
+"""Testing memoization of repeated expressions in string literals (UTF8_INTERPY_MEMOIZE)."""
+import os
+import subprocess
+import sys
+from utf8_interpy import compat
+from utf8_interpy import preprocessor
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def _transform(source, mode='safe'):
+    memoize, preprocessor.memoize = preprocessor.memoize, mode
+    try:
+        return compat.untokenize_text(preprocessor.tokenize_and_preprocess_text(source))
+    finally:
+        preprocessor.memoize = memoize
+
+calls = []
+def f(value):
+    calls.append(value)
+    return value
+
+def _run(source, mode):
+    # evaluate transformed source, returning value of 'x' and calls of f()
+    del calls[:]
+    namespace = {'f': f, 'a': [1, 2], 'd': {'k': 'v'}, 'name': 'n'}
+    exec(_transform(source, mode), namespace)
+    return namespace['x'], len(calls)
+
+source = 'x = ("#{a[0]}#{name}#{f(1)}/#{a[0]}#{name}#{f(1)}/#{d[\'k\']}" # comment\n     "#{d[\'k\']}#{a[-1]}#{a[-1]}")\n'
+
+# same result, but only expressions without side effects are evaluated once by default
+memo_evaluate_interp = [_run(source, None), _run(source, 'safe'), _run(source, 'all')]
+memo_evaluate_expect = [('1n1/1n1/vv22', 2), ('1n1/1n1/vv22', 2), ('1n1/1n1/vv22', 1)]
+
+# the group of literals is evaluated in a function, called with all its expressions, repeated ones once
+def _arguments(literals, mode):
+    memoize, preprocessor.memoize = preprocessor.memoize, mode
+    try:
+        return preprocessor.preprocess_string_group(literals)[1]
+    finally:
+        preprocessor.memoize = memoize
+
+memo_arguments_interp = [_arguments(['"#{a[0]}#{name}#{f(1)}/#{a[0]}#{name}#{f(1)}#{1+1}"', '"#{a[-1]}"'], mode) for mode in ['safe', 'all']] + \
+                        [_arguments(['"#{name}/#{name}#{a[0]}"'], 'safe'), _arguments(['"#{x, y}#{(yield)}#{yield a[0]}#{a[0]}#{a[0]}"'], 'safe')]
+memo_arguments_expect = [['a[0]', 'name', 'f(1)', 'f(1)', 'a[-1]'], ['a[0]', 'name', 'f(1)', 'a[-1]'],
+                         [], ['(x, y)', '(yield)', '(yield a[0])', 'a[0]']] # (names alone aren't worth it)
+
+# single occurrences and other statements are left as is
+memo_single_interp = _transform('x = "#{a[0]}" + "#{a[0]}"\n')
+memo_single_expect = _transform('x = "#{a[0]}" + "#{a[0]}"\n', None)
+
+# generated code
+if compat.has_fstrings:
+    memo_generated_interp = preprocessor.preprocess_string_group(['"#{a[0]}/#{a[0]}"', '"#{a[0]}"'])
+    memo_generated_expect = (['f"{_interpy_m0}/{_interpy_m0}"', 'f"{_interpy_m0}"'], ['a[0]'])
+
+memo_generated_source_interp = _transform('x = ("#{a[0]}/#{a[0]}" # comment\n     "!") + "z"\n')
+memo_generated_source_expect = ('x = ((lambda _interpy_m0:f"{_interpy_m0}/{_interpy_m0}" # comment\n     "!")(a[0])) + "z"\n' if compat.has_fstrings else
+                                'x = ((lambda _interpy_m0:(%s(_interpy_m0)+"/"+%s(_interpy_m0)) # comment\n     +"!")(a[0])) + "z"\n' % (compat.text_type_str, compat.text_type_str))
+
+# no names are assigned in the enclosing scope, so comprehensions (also in a class body) are fine
+memo_scopes_source = ('ys = [c for c in "#{a[0]}-#{a[0]}"]\n'
+                      'zs = [c for c in "ab" if "#{a[0]}#{a[0]}"]\n'
+                      'class C:\n'
+                      '    b = [3]\n'
+                      '    ws = [c for c in "#{b[0]}#{b[0]}"]\n'
+                      '    t = "#{b[0]}/#{b[0]}"\n'
+                      '    u = [c + "#{a[0]}#{a[0]}" for c in "x"]\n')
+def _scopes():
+    namespace = {'a': [1]}
+    exec(_transform(memo_scopes_source), namespace)
+    C = namespace['C']
+    leaked = [name for name in list(namespace) + list(vars(C)) if name.startswith('_interpy')]
+    return namespace['ys'], namespace['zs'], C.ws, C.t, C.u, leaked
+memo_scopes_interp = _scopes()
+memo_scopes_expect = (['1', '-', '1'], ['a', 'b'], ['3', '3'], '3/3', ['x11'], [])
+
+# option is read from the environment, and is part of the cache keys and .pyc tags
+def _options(value):
+    env = dict(os.environ, UTF8_INTERPY_MEMOIZE=value)
+    code = 'from utf8_interpy import preprocessor; print(preprocessor.memoize, preprocessor.options_tag() or "-")'
+    return subprocess.check_output([sys.executable, '-c', code], cwd=root, env=env).decode('ascii').split()
+
+memo_options_interp = [_options(''), _options('1'), _options('all')]
+memo_options_expect = [['None', '-'], ['safe', 'memo-safe'], ['all', 'memo-all']]
@@ -0,0 +1,50 @@
+"""Testing the in-process transform cache."""
+import codecs
+from io import BytesIO
+from utf8_interpy import cache
+from utf8_interpy import codec
+
+source = b'# coding: utf8-interpy\nvar = 1\nfoobar = "#{var}"\n'
+
+lru = cache.MemoryCache(max_items=2)
+
+# miss, put, hit
+lru_miss_interp = lru.get('a')
+lru_miss_expect = None
+
+lru.put('a', 1)
+lru.put('b', 2)
+lru_hit_interp = lru.get('a')
+lru_hit_expect = 1
+
+lru_counters_interp = (lru.hits, lru.misses)
+lru_counters_expect = (1, 1)
+
+# least recently used entry ('b'; 'a' was just read) is evicted
+lru.put('c', 3)
+lru_evict_interp = [lru.get(key) for key in ['a', 'b', 'c']]
+lru_evict_expect = [1, None, 3]
+
+# shrinking evicts least recently used entries
+lru.resize(1)
+lru_resize_interp = [lru.get(key) for key in ['a', 'c']]
+lru_resize_expect = [None, 3]
+
+# size 0 disables caching
+lru.resize(0)
+lru.put('d', 4)
+lru_disabled_interp = (lru.get('d'), len(lru))
+lru_disabled_expect = (None, 0)
+
+# decoding the same source repeatedly hits the global cache, both from 
+# the stateless decoder and the stream reader
+cache.memory_cache.clear()
+decoded = codec.interpy_decode(source)
+codec.interpy_decode(memoryview(source))
+codecs.getreader('utf8-interpy')(BytesIO(source)).read()
+codec_decode_interp = (cache.memory_cache.hits, cache.memory_cache.misses)
+codec_decode_expect = (2, 1)
+
+# cached result is the same as uncached
+codec_cached_interp = decoded
+codec_cached_expect = (codec.transform_text(source.decode('utf-8')), len(source))
@@ -0,0 +1,34 @@
+# coding: utf8-interpy
+"""Testing braces and string literals nested inside interpolations."""
+
+var = 'foobar'
+adict = {'{': 'open', '}': 'close', 'a': 1}
+
+# braces inside nested string literal
+nested_open_interp = "#{adict['{']}"
+nested_open_expect = 'open'
+
+nested_close_interp = "#{adict['}']}"
+nested_close_expect = 'close'
+
+nested_literal_interp = "#{'}'}#{'{'}"
+nested_literal_expect = '}{'
+
+# double quoted nested string literal inside triple quoted string
+nested_double_interp = """#{adict["}"]}"""
+nested_double_expect = 'close'
+
+# escaped quote inside nested string literal
+nested_escaped_interp = "#{'\'}'}"
+nested_escaped_expect = "'}"
+
+# nested braces
+nested_dict_interp = "#{ {'a': 1}['a'] }"
+nested_dict_expect = '1'
+
+nested_set_interp = "#{len({1, 2})}"
+nested_set_expect = '2'
+
+# quotes outside interpolations are not special
+apostrophe_interp = "isn't #{var}'s"
+apostrophe_expect = "isn't foobar's"
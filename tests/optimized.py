@@ -0,0 +1,52 @@
+# coding: utf8-interpy
+"""Testing compactness of generated string concatenation expressions, and implicit string concatenation."""
+import sys
+from utf8_interpy import codec
+from utf8_interpy import compat
+from utf8_interpy import preprocessor
+
+var1 = 'foo'
+var2 = 'bar'
+
+def concatenation(s):
+    quotes, parts = preprocessor.split_string(s)
+    exprs = [preprocessor.tokenize_expression(preprocessor.split_field(parts[i])[0]) for i in range(1, len(parts), 2)]
+    return preprocessor.format_concatenation(preprocessor.concatenation_operands(quotes, parts, exprs))
+
+# empty string literals are dropped
+drop_empty_interp = concatenation('"#{foo}#{foo}"')
+drop_empty_expect = '(' + compat.text_type_str + '(foo)+' + compat.text_type_str + '(foo))'
+
+drop_empty_triple_interp = concatenation('"""#{foo}\n"""')
+drop_empty_triple_expect = '(' + compat.text_type_str + '(foo)+"""\n""")'
+
+# text around empty expressions is merged
+merge_empty_interp = concatenation('"a#{}b#{ }c"')
+merge_empty_expect = '("abc")'
+
+only_empty_interp = concatenation('"#{}"')
+only_empty_expect = '("")'
+
+# no str() conversion of string literal expressions
+text_literal_interp = concatenation('"a#{\'b\' \'c\'}"')
+text_literal_expect = '("a"+\'b\' \'c\')' if sys.version_info.major >= 3 else '("a"+' + compat.text_type_str + '(\'b\' \'c\'))'
+
+bytes_literal_interp = concatenation('"#{b\'b\'}"')
+bytes_literal_expect = '(' + compat.text_type_str + '(b\'b\'))'
+
+# implicitly concatenated strings following a concatenation expression
+concat_plain_interp = "#{var1}#{}" 'x'
+concat_plain_expect = 'foox'
+
+concat_plain_nl_interp = ("#{var1}#{}"
+                          'x')
+concat_plain_nl_expect = 'foox'
+
+# implicitly concatenated f-strings are left to the compiler to merge
+if compat.has_fstrings:
+    implicit_generated_interp = codec.transform_bytes_string(b'a = "#{var1}x" "y#{var2}"\n')
+    implicit_generated_expect = b'a = f"{var1}x" f"y{var2}"\n'
+
+    # implicit string concatenation binds tighter than any operator
+    implicit_format_interp = "#{var1} %s" "-%s" % (1, 2)
+    implicit_format_expect = 'foo 1-2'
@@ -0,0 +1,63 @@
+"""Testing mapping of transformed columns back to original columns."""
+import shutil
+import tempfile
+from utf8_interpy import cache
+from utf8_interpy import codec
+from utf8_interpy import sourcemap
+
+# (braces in text are escaped in f-strings, so these certainly change length)
+source = b'''x = "{a} #{a}" "#{c}" + foo(1); bar = 2
+y = """#{a}
+{c} #{c}""" + baz
+z = (1, "plain", qux)
+'''
+lines = source.decode('utf-8').splitlines()
+
+def _columns(name):
+    # column of name in original, and mapped back from transformed source
+    text, source_map = codec.transform_source_map(source)
+    for row, (line_in, line_out) in enumerate(zip(lines, text.splitlines()), 1):
+        if name in line_in:
+            return line_in.index(name), source_map.original_column(row, line_out.index(name))
+
+# tokens after interpolated strings on the same line
+same_line_interp = [_columns('foo'), _columns('bar')]
+same_line_expect = [_columns('foo')[:1] * 2, _columns('bar')[:1] * 2]
+
+# tokens after multi-line interpolated string, and lines without interpolation
+multi_line_interp = [_columns('baz'), _columns('qux')]
+multi_line_expect = [_columns('baz')[:1] * 2, _columns('qux')[:1] * 2]
+
+# no breakpoints without interpolations
+plain_interp = len(codec.transform_source_map(b'x = "{a}"\n')[1])
+plain_expect = 0
+
+# breakpoints are only added where the offset changes
+source_map = sourcemap.SourceMap()
+source_map.add(1, 4, 4)
+source_map.add(1, 10, 8)
+source_map.add(1, 12, 10)
+source_map.add(2, 0, 0)
+source_map.add(3, 5, 7)
+breakpoints_interp = (list(source_map.rows), list(source_map.tcols), list(source_map.ocols))
+breakpoints_expect = ([1, 3], [10, 5], [8, 7])
+
+map_lookup_interp = [source_map.original_column(1, 3), source_map.original_column(1, 11), source_map.original_column(2, 7), source_map.original_column(3, 6)]
+map_lookup_expect = [3, 9, 7, 8]
+
+# serialized, e.g. for the disk cache
+roundtrip_interp = sourcemap.SourceMap.from_bytes(source_map.to_bytes())
+roundtrip_expect = source_map
+
+# cached along with transformed source
+root = tempfile.mkdtemp()
+cache.enable_disk_cache(root)
+try:
+    cache.memory_cache.clear()
+    source_map = codec.transform_source_map(source)[1]
+    cache.memory_cache.clear()                                  # force reading from disk
+    cached_interp = cache.get_source_map(cache.source_digest(source)) if cache.get(cache.source_digest(source)) is not None else None
+    cached_expect = source_map
+finally:
+    cache.disable_disk_cache()
+    shutil.rmtree(root)
@@ -0,0 +1,112 @@
+"""Testing incremental (statement-by-statement) decoding."""
+import codecs
+import io
+import linecache
+import os
+import shutil
+import tempfile
+from io import BytesIO
+from utf8_interpy import cache
+from utf8_interpy import codec
+
+source = b'''# coding: utf8-interpy
+var = 1
+def foo(x):
+\tif x:
+\t\treturn ("a #{x}"
+\t\t\t"b")
+\t"""docstring-like #{x}"""
+\treturn """multi
+#{x} line"""
+
+bar = ["#{var}",
+       "#{var + 1}"]
+'''
+
+def _decode_chunked(data, size):
+    decoder = codecs.getincrementaldecoder('utf8-interpy')()
+    parts = [decoder.decode(data[i:i+size]) for i in range(0, len(data), size)]
+    return parts + [decoder.decode(b'', final=True)]
+
+# same result as decoding all at once, whatever the chunk size
+chunked_interp = [u''.join(_decode_chunked(source, size)) for size in [1, 5, 64]]
+chunked_expect = [codec.interpy_decode(source)[0]] * 3
+
+# output is produced at the end of each statement, before the end of the input
+decoder = codecs.getincrementaldecoder('utf8-interpy')()
+statement_interp = [decoder.decode(b'# coding: utf8-interpy\nvar = 1\nfoo = "#{var}"'), decoder.decode(b'\nbar = (1,\n'), decoder.decode(b' 2)\n')]
+statement_expect = [u'# coding: utf8-interpy\nvar = 1\n', u'foo = f"{var}"\n', u'bar = (1,\n 2)\n'] if codec.compat.has_fstrings else \
+    [u'# coding: utf8-interpy\nvar = 1\n', u'foo = (str(var))\n', u'bar = (1,\n 2)\n']
+
+# only the current statement is buffered, not the entire input
+decoder = codecs.getincrementaldecoder('utf8-interpy')()
+buffered = 0
+for i in range(0, 100):
+    decoder.decode(('foo%d = "#{var}"\n' % i).encode('ascii'))
+    buffered = max(buffered, len(decoder.buffer))
+buffered_interp = buffered
+buffered_expect = 0
+
+# stream reader transforms while reading
+reader = codecs.getreader('utf8-interpy')(BytesIO(source))
+reader_interp = reader.readlines()
+reader_expect = codec.interpy_decode(source)[0].splitlines(True)
+
+# a source read again (e.g. by linecache, for every traceback) is transformed all at once,
+# using the transform of the first read, which is cached, also when larger than a chunk
+root = tempfile.mkdtemp()
+try:
+    linecache_sizes = []
+    linecache_hits = []
+    for n in [3, 2000]:
+        path = os.path.join(root, 'lines%d.py' % n)
+        data = b'# coding: utf8-interpy\nvar = 1\n' + b''.join(('foo%d = "#{var}"\n' % i).encode('ascii') for i in range(n))
+        with open(path, 'wb') as f:
+            f.write(data)
+        linecache_sizes.append(len(data) > 8192)
+        cache.memory_cache.clear()
+        preprocessed = codec.stats['preprocessed']
+        for i in range(3):
+            linecache.clearcache()
+            lines = linecache.getlines(path)
+        linecache_hits.append((cache.memory_cache.hits, cache.memory_cache.misses, codec.stats['preprocessed'] > preprocessed, lines == codec.interpy_decode(data)[0].splitlines(True)))
+    linecache_hits_interp = (linecache_sizes, linecache_hits)
+    linecache_hits_expect = ([False, True], [(2, 0, True, True)] * 2)
+finally:
+    shutil.rmtree(root)
+
+# text files can tell() the position mid-stream (decoding part of the input again), and seek() back to it
+root = tempfile.mkdtemp()
+try:
+    path = os.path.join(root, 'tell.py')
+    data = b'# coding: utf8-interpy\n' + b''.join(('def foo%d(x):\n    if x:\n        return "#{x} a"\n    return "#{x} b"\n\n' % i).encode('ascii') for i in range(1000))
+    with open(path, 'wb') as f:
+        f.write(data)
+    codec._source_sizes.clear()
+    cache.memory_cache.clear()                                      # stream, rather than transforming all at once
+    with io.open(path, encoding='utf8-interpy') as f:
+        lines = []
+        for i in range(3000):
+            lines.append(f.readline())
+            if i % 500 == 0:
+                f.tell()
+        lines.append(f.read())
+        tell_interp = u''.join(lines)
+    tell_expect = codec.interpy_decode(data)[0]
+
+    codec._source_sizes.clear()
+    cache.memory_cache.clear()
+    with io.open(path, encoding='utf8-interpy') as f:
+        seeks = []
+        for i in range(3000):
+            f.readline()
+            if i % 500 == 0:
+                pos = f.tell()
+                rest = f.read(100)
+                f.seek(pos)
+                seeks.append(f.read(100) == rest)
+                f.seek(pos)
+        seek_interp = (seeks, tell_expect.endswith(f.read()))
+    seek_expect = ([True] * 6, True)
+finally:
+    shutil.rmtree(root)
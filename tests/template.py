@@ -0,0 +1,67 @@
+"""Testing run-time interpolation of template text."""
+import utf8_interpy
+from utf8_interpy import template
+
+name = 'world'
+
+def _locals(x):
+    y = 'local'
+    return template.interpolate('#{x} #{y} #{name}')
+
+# expressions are evaluated in the caller's namespaces by default, or in the given ones
+caller_interp = [template.interpolate('Hello #{name}!'), _locals(1)]
+caller_expect = ['Hello world!', '1 local world']
+
+namespaces_interp = [template.interpolate('#{a}, #{b}', {'a': 1, 'b': 2}), template.interpolate('#{a}, #{b}', {'a': 1, 'b': 2}, {'b': 3})]
+namespaces_expect = ['1, 2', '1, 3']
+
+# package level wrapper
+def _wrapper(x):
+    return utf8_interpy.interpolate('#{x}#{name}')
+wrapper_interp = [_wrapper(1), utf8_interpy.interpolate('#{a}', {'a': 1})]
+wrapper_expect = ['1world', '1']
+
+# template text is taken literally, expressions may contain any quotes
+d = {'k': [1, 2]}
+literal_interp = [template.interpolate('"q" \'s\' {b} \\n \x00\n#{1}'), template.interpolate('#{d["k"]} #{d[\'k\'][0]} #{"a" + \'b\'} #{ {"k": 1}["k"] }')]
+literal_expect = ['"q" \'s\' {b} \\n \x00\n1', '[1, 2] 1 ab 1']
+
+template_tuple_interp = template.interpolate('#{1, 2} #{}')
+template_tuple_expect = '(1, 2) '
+
+# each template is compiled once
+template_cached_interp = template.compiled('#{name}!') is template.compiled('#{name}!')
+template_cached_expect = True
+
+def _error(text):
+    try:
+        template.interpolate(text)
+    except SyntaxError:
+        return 'SyntaxError'
+    return 'no error'
+
+syntax_error_interp = [_error('#{1 +}'), _error('#{(1}'), _error('#{1}')]
+syntax_error_expect = ['SyntaxError', 'SyntaxError', 'no error']
+
+# rendering over many records; fields of records are locals, other names globals
+datdir = '/data'
+ndim = {'mfcc': 13, 'fbank': 40}
+paths = template.Template('#{datdir}/feat/#{feat}_#{ndim[feat]}/#{name}.npy')
+records = [{'feat': 'mfcc', 'name': 'a'}, {'feat': 'fbank', 'name': 'b'}, {'feat': 'mfcc', 'name': 'c', 'datdir': '/other'}, {'feat': 'fbank'}]
+render_many_interp = [list(paths.render_many(records)), list(paths.render_many(records, batch_size=2)), list(paths.render_many([]))]
+render_many_expect = [[['/data/feat/mfcc_13/a.npy', '/data/feat/fbank_40/b.npy', '/other/feat/mfcc_13/c.npy', '/data/feat/fbank_40/world.npy']],
+                      [['/data/feat/mfcc_13/a.npy', '/data/feat/fbank_40/b.npy'], ['/other/feat/mfcc_13/c.npy', '/data/feat/fbank_40/world.npy']], []]
+
+# fields are those of each record, as for render()
+render_many_fields_interp = [result for batch in paths.render_many(records) for result in batch]
+render_many_fields_expect = [paths.render(record) for record in records]
+
+columns = {'feat': ['mfcc', 'fbank'], 'name': ('a', 'b'), 'unused': [1, 2]}
+render_columns_interp = [list(paths.render_columns(columns)), list(template.Template('#{x}!').render_columns({'x': range(3)})), list(template.Template('const').render_columns({'x': [1, 2]}))]
+render_columns_expect = [[['/data/feat/mfcc_13/a.npy', '/data/feat/fbank_40/b.npy']], [['0!', '1!', '2!']], [['const', 'const']]]
+
+render_interp = [paths.render(feat='fbank', name='x'), paths.render({'feat': 'fbank', 'name': 'x', 'datdir': '/other'}), template.Template('#{a}', {'a': 1}).render()]
+render_expect = ['/data/feat/fbank_40/x.npy', '/other/feat/fbank_40/x.npy', '1']
+
+template_names_interp = template.template_names('#{a.b} #{f(a, x=c)} #{[v for v in d if v is not None]}')
+template_names_expect = ['a', 'f', 'x', 'c', 'v', 'd']
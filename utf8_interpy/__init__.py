@@ -0,0 +1,29 @@
+# NOTE: this package is imported at start-up of every Python process (through utf8_interpy.pth 
+# and utf8_interpy.bootstrap), so only define thin wrappers here which import the actual 
+# implementation when called.
+from sys import _getframe
+
+def transform_many(paths, workers=None, chunk_size=8):
+    """Transform utf8-interpy source files in given files and directory trees in parallel,
+    generating tuples of path, status, transformed text and error message (see utf8_interpy.batch)."""
+    from .batch import transform_many
+    return transform_many(paths, workers, chunk_size)
+
+def interpolate(template, globals=None, locals=None):
+    """Interpolate #{..} tags in template text at run time, evaluating expressions in the 
+    namespaces of the caller by default; templates are compiled once (see utf8_interpy.template)."""
+    if globals is None:
+        frame = _getframe(1)
+        globals = frame.f_globals
+        if locals is None:
+            locals = frame.f_locals
+    from .template import interpolate
+    return interpolate(template, globals, locals)
+
+def __getattr__(name):
+    # (Py3.7+) import run-time support on first use by generated code (see preprocessor.lazy_prefix); 
+    # after that, it's found as an attribute of the package without calling this
+    if name == 'runtime':
+        import importlib
+        return importlib.import_module('.runtime', __name__) # (not 'from . import', which calls this again)
+    raise AttributeError("module 'utf8_interpy' has no attribute %r" % name)
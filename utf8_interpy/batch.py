@@ -0,0 +1,59 @@
+"""Transform many utf8-interpy source files in parallel, for tooling such as linters, 
+IDE indexers and test collectors.
+
+>>> import utf8_interpy
+>>> for path, status, text, message in utf8_interpy.transform_many(['src/'], workers=8):
+...     lint(path, text)
+"""
+from __future__ import absolute_import
+from . import cache
+from . import codec
+from .compileall import find_sources
+
+default_chunk_size = 8  # number of files per task sent to a worker process
+
+def transform_file(path):
+    """Read and transform a single source file, if it uses the utf8-interpy encoding.
+
+    Returns tuple of path, status ('transformed', 'skipped' or 'error'), 
+    transformed source text (or None), and error message (or None)."""
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+        if not codec.is_interpy_source(data):
+            return path, 'skipped', None, None
+        text = codec.transform_source_text(data)
+    except (IOError, OSError, ValueError) as e: # ValueError includes UnicodeDecodeError
+        return path, 'error', None, '%s: %s' % (type(e).__name__, e)
+    return path, 'transformed', text, None
+
+def _transform_files(paths, disk_cache_config):
+    # runs in a worker process, which may have been spawned rather than forked,
+    # so share the persistent cache of the parent process explicitly
+    if disk_cache_config is not None and (cache.disk_cache is None or (cache.disk_cache.root, cache.disk_cache.max_size) != disk_cache_config):
+        cache.enable_disk_cache(*disk_cache_config)
+    return [transform_file(path) for path in paths]
+
+def transform_many(paths, workers=None, chunk_size=default_chunk_size):
+    """Transform source files in given files and directory trees, using a pool of 
+    worker processes (workers=1 transforms in the current process).
+
+    Generates the results of transform_file(), as soon as each group of files is done;
+    i.e. not necessarily in the order of paths."""
+    sources = list(find_sources(paths))
+    if workers != 1:
+        try:
+            from concurrent.futures import ProcessPoolExecutor, as_completed
+        except ImportError:
+            workers = 1 # Py2 without 'futures' backport
+    if workers == 1 or len(sources) <= 1:
+        for path in sources:
+            yield transform_file(path)
+        return
+
+    disk_cache_config = (cache.disk_cache.root, cache.disk_cache.max_size) if cache.disk_cache is not None else None
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_transform_files, sources[i:i+chunk_size], disk_cache_config) for i in range(0, len(sources), chunk_size)]
+        for future in as_completed(futures):
+            for result in future.result():
+                yield result
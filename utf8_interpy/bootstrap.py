@@ -0,0 +1,17 @@
+"""Minimal codec registration, imported by utf8_interpy.pth at start-up of every Python process.
+
+Importing the codec itself pulls in the pre-processor, tokenize, etc., which most processes 
+never need; here only a search function is registered, which imports the codec the first 
+time the 'utf8-interpy' encoding is actually looked up."""
+import codecs
+
+# Same as codec.encoding_name and codec.encoding_aliases
+_encoding_names = ('utf8-interpy', 'utf8_interpy', 'utf8interpy')
+
+def search_interpy(encoding):
+    if encoding not in _encoding_names:
+        return None
+    from . import codec
+    return codec.search_interpy(encoding)
+
+codecs.register(search_interpy)
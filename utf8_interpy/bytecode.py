@@ -0,0 +1,99 @@
+"""Helpers to compile transformed source code, and to write and check .pyc files."""
+import marshal
+import os
+import struct
+import sys
+import tempfile
+from . import compat
+
+if sys.version_info.major >= 3:
+    import importlib.util
+
+    magic = importlib.util.MAGIC_NUMBER
+    has_pyc_flags = sys.version_info >= (3, 7)  # PEP 552
+
+    def cache_path(source_path, tag=None):
+        """Path of .pyc file the import system uses for a source file, 
+        optionally with an additional tag (e.g. 'foo.cpython-311.tag.pyc')."""
+        path = importlib.util.cache_from_source(source_path)
+        if tag:
+            path = path[:-len('.pyc')] + '.' + tag + '.pyc'
+        return path
+
+    def compile_source(data, path):
+        """Compile transformed source (text, or bytes string UTF-8 encoded) to code object."""
+        # compile text, so the compiler doesn't decode (i.e. transform) again using the encoding cookie
+        if isinstance(data, bytes):
+            data = data.decode('utf-8')
+        return compile(data, path, 'exec', dont_inherit=True)
+else:
+    import imp
+
+    magic = imp.get_magic()
+    has_pyc_flags = False
+
+    def cache_path(source_path, tag=None):
+        path = source_path + ('c' if __debug__ else 'o')
+        if tag:
+            path = path[:-len('.pyc')] + '.' + tag + path[-len('.pyc'):]
+        return path
+
+    def compile_source(data, path):
+        # Py2 doesn't allow an encoding cookie in unicode source, so compile bytes;
+        # the source is decoded by the codec again, but there is little left to transform
+        return compile(data, path, 'exec', dont_inherit=True)
+
+def pyc_header(mtime, size):
+    """Header of timestamp based .pyc file for source with given modification time and size."""
+    mtime = int(mtime) & 0xFFFFFFFF
+    if sys.version_info.major < 3:
+        return magic + struct.pack('<I', mtime)
+    header = magic
+    if has_pyc_flags:
+        header += struct.pack('<I', 0)
+    return header + struct.pack('<II', mtime, size & 0xFFFFFFFF)
+
+def check_pyc(pyc_path, mtime, size):
+    """Check if .pyc file exists and was compiled from source with given modification time and size."""
+    header = pyc_header(mtime, size)
+    try:
+        with open(pyc_path, 'rb') as f:
+            return f.read(len(header)) == header
+    except (IOError, OSError):
+        return False
+
+def load_pyc(pyc_path, mtime, size):
+    """Load code object from .pyc file, if it exists and was compiled from source with given 
+    modification time and size; otherwise returns None."""
+    header = pyc_header(mtime, size)
+    try:
+        with open(pyc_path, 'rb') as f:
+            data = f.read()
+    except (IOError, OSError):
+        return None
+    if data[:len(header)] != header:
+        return None
+    try:
+        return marshal.loads(data[len(header):])
+    except (EOFError, ValueError, TypeError):
+        return None # corrupt
+
+def write_pyc(pyc_path, code, mtime, size, mode=0o644):
+    """Atomically write code object to .pyc file."""
+    dir = os.path.dirname(pyc_path) or '.'
+    if not os.path.isdir(dir):
+        try:
+            os.makedirs(dir)
+        except OSError:
+            if not os.path.isdir(dir): # not created concurrently
+                raise
+    fd, tmp_path = tempfile.mkstemp(prefix='.tmp-', dir=dir)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(pyc_header(mtime, size))
+            f.write(marshal.dumps(code))
+        os.chmod(tmp_path, mode)
+        compat.replace_file(tmp_path, pyc_path)
+    except:
+        os.remove(tmp_path)
+        raise
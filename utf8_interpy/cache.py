@@ -0,0 +1,307 @@
+"""Caches of transformed source code, keyed by a digest of the input bytes."""
+import hashlib
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from . import compat
+from . import preprocessor
+from . import sourcemap
+
+# Environment variables used to configure the caches
+env_cache_dir         = 'UTF8_INTERPY_CACHE_DIR'
+env_cache_size        = 'UTF8_INTERPY_CACHE_SIZE'
+env_memory_cache_size = 'UTF8_INTERPY_MEMORY_CACHE_SIZE'
+
+default_max_size         = 64*1024*1024 # in bytes
+default_memory_max_items = 64           # in number of entries
+
+# Transformed output depends on the pre-processor (and its options) and on the Python version
+# (e.g. generated code may use newer syntax), so these are all part of the key.
+def _digest_salt():
+    # (options may be changed after import, e.g. preprocessor.fold_max_size)
+    return ('utf8-interpy %s py%d.%d\0' % ((' '.join([preprocessor.version, preprocessor.options_tag()]).strip(),) + tuple(sys.version_info[:2]))).encode('ascii')
+
+def source_digest(input):
+    """Compute cache key of (untransformed) bytes string; accepts any bytes-like object."""
+    h = hashlib.sha1(_digest_salt())
+    h.update(input)
+    return h.hexdigest()
+
+
+class MemoryCache(object):
+    """Bounded in-process LRU cache.
+
+    The same source is typically decoded several times per process (import, 
+    linecache for every traceback, inspect.getsource(), coverage, ...); this 
+    avoids running the pre-processor again each time."""
+
+    def __init__(self, max_items=default_memory_max_items):
+        self.max_items = max_items
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return cached value, or None if not cached."""
+        with self._lock:
+            try:
+                value = self._items.pop(key)
+            except KeyError:
+                self.misses += 1
+                return None
+            self._items[key] = value # re-insert as most recently used
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._items.pop(key, None)
+            if self.max_items <= 0:
+                return
+            self._items[key] = value
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False) # least recently used
+
+    def resize(self, max_items):
+        with self._lock:
+            self.max_items = max_items
+            while len(self._items) > max(max_items, 0):
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self):
+        return len(self._items)
+
+
+class DiskCache(object):
+    """Content-addressed on-disk cache of transformed source.
+
+    Entries are stored as '<root>/<digest[:2]>/<digest>'. Entries are written to a
+    temporary file which is then atomically renamed into place, so concurrent readers
+    (possibly other processes) never see partially written entries. On every hit the
+    modification time of the entry is refreshed, so the least recently used entries
+    can be evicted once the total size of the cache exceeds max_size. 
+
+    The total size is shared by all processes using the cache: it is written to 
+    '<root>/size' whenever the entries are listed, and the size of every entry added 
+    since is appended to '<root>/size.log'; so the entries are only listed once the 
+    total exceeds max_size (or if the size file is missing). Sizes of entries added 
+    while another process lists the entries may be missed, so the total is approximate."""
+
+    stale_tmp_age = 3600 # remove temporary files of crashed writers after this many seconds
+    evict_ratio = 0.9    # evict to this fraction of max_size, so the cache isn't listed on every put when full
+
+    def __init__(self, root, max_size=default_max_size):
+        self.root = root
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._size_path = os.path.join(root, 'size')
+        self._size_log_path = os.path.join(root, 'size.log')
+
+    def _path(self, digest):
+        return os.path.join(self.root, digest[:2], digest)
+
+    def _total_size(self):
+        """Total size of the entries as last listed plus sizes added since, None if unknown."""
+        try:
+            with open(self._size_path, 'rb') as f:
+                total = int(f.read())
+            with open(self._size_log_path, 'rb') as f:
+                added = f.read().split()
+        except (IOError, OSError, ValueError):
+            return None
+        return total + sum(int(size) for size in added if size.isdigit()) # (skips a line being written)
+
+    def _write_size(self, total):
+        try:
+            fd, tmp_path = tempfile.mkstemp(prefix='.tmp-', dir=self.root)
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(str(total).encode('ascii'))
+                compat.replace_file(tmp_path, self._size_path)
+            except:
+                os.remove(tmp_path)
+                raise
+            open(self._size_log_path, 'wb').close()
+        except (IOError, OSError):
+            pass
+
+    def get(self, digest):
+        """Return cached bytes string, or None if not cached."""
+        path = self._path(digest)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except (IOError, OSError):
+            self.misses += 1
+            return None
+        try:
+            os.utime(path, None) # mark as recently used
+        except OSError:
+            pass # evicted concurrently; we already have the data
+        self.hits += 1
+        return data
+
+    def put(self, digest, data):
+        """Store bytes string; failures (e.g. read-only file system) are silently ignored."""
+        path = self._path(digest)
+        try:
+            dir = os.path.dirname(path)
+            if not os.path.isdir(dir):
+                try:
+                    os.makedirs(dir)
+                except OSError:
+                    if not os.path.isdir(dir): # not created concurrently
+                        raise
+            fd, tmp_path = tempfile.mkstemp(prefix='.tmp-', dir=dir)
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(data)
+                compat.replace_file(tmp_path, path)
+            except:
+                os.remove(tmp_path)
+                raise
+            with open(self._size_log_path, 'ab') as f:
+                f.write(('%d\n' % len(data)).encode('ascii')) # (over-estimates when replacing an entry)
+        except (IOError, OSError):
+            return
+        total = self._total_size()
+        if total is None or total > self.max_size:
+            self.evict()
+
+    def remove(self, digest):
+        """Remove entry, if cached."""
+        try:
+            os.remove(self._path(digest))
+        except OSError:
+            pass
+
+    def _entries(self):
+        """List (mtime, size, path) of all entries, removing stale temporary files on the way."""
+        entries = []
+        now = time.time()
+        try:
+            dirs = os.listdir(self.root)
+        except OSError:
+            return entries
+        for dir in dirs:
+            dir = os.path.join(self.root, dir)
+            try:
+                names = os.listdir(dir)
+            except OSError:
+                continue # not a directory, or removed concurrently
+            for name in names:
+                path = os.path.join(dir, name)
+                try:
+                    st = os.stat(path)
+                    if name.startswith('.tmp-'):
+                        if now - st.st_mtime > self.stale_tmp_age:
+                            os.remove(path)
+                        continue
+                except OSError:
+                    continue # removed concurrently
+                entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    def evict(self):
+        """Remove least recently used entries if the total size exceeds max_size, 
+        until it is below max_size * evict_ratio."""
+        entries = self._entries()
+        total = sum(size for mtime, size, path in entries)
+        if total > self.max_size:
+            entries.sort()
+            for mtime, size, path in entries:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass # removed concurrently (or in use on Windows)
+                total -= size
+                if total <= self.max_size * self.evict_ratio:
+                    break
+        self._write_size(total)
+
+    def clear(self):
+        for mtime, size, path in self._entries():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        for path in [self._size_path, self._size_log_path]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+# Global caches used by the codec; the disk cache is disabled unless configured
+memory_cache = MemoryCache(int(os.environ.get(env_memory_cache_size) or default_memory_max_items))
+disk_cache = None
+
+def default_cache_dir():
+    """Default persistent cache location ($XDG_CACHE_HOME/utf8_interpy or ~/.cache/utf8_interpy)."""
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'utf8_interpy')
+
+def enable_disk_cache(root=None, max_size=default_max_size):
+    """Enable the persistent on-disk cache of transformed source code."""
+    global disk_cache
+    disk_cache = DiskCache(root or default_cache_dir(), max_size)
+    return disk_cache
+
+def disable_disk_cache():
+    global disk_cache
+    disk_cache = None
+
+if os.environ.get(env_cache_dir):
+    enable_disk_cache(os.environ[env_cache_dir], int(os.environ.get(env_cache_size) or default_max_size))
+
+def set_memory_cache_size(max_items):
+    """Change maximum number of entries of the in-process cache (0 disables it)."""
+    memory_cache.resize(max_items)
+
+def get(digest):
+    """Look up transformed source text by digest of its input, returns None if not cached."""
+    entry = memory_cache.get(digest)
+    if entry is None and disk_cache is not None:
+        data = disk_cache.get(digest)
+        if data is not None:
+            try:
+                entry = (data.decode('utf-8'), None) # source map is read from disk when needed
+            except UnicodeDecodeError:
+                disk_cache.remove(digest) # corrupt entry; transformed (and stored) again
+                return None
+            memory_cache.put(digest, entry)
+    return entry[0] if entry is not None else None
+
+def put(digest, text, source_map=None):
+    """Store transformed source text, and optionally its SourceMap, by digest of its input 
+    (in memory as is; on disk text encoded as UTF-8, and the source map in a separate entry)."""
+    memory_cache.put(digest, (text, source_map))
+    if disk_cache is not None:
+        disk_cache.put(digest, text.encode('utf-8'))
+        if source_map is not None:
+            disk_cache.put(digest + '.map', source_map.to_bytes())
+
+def get_source_map(digest):
+    """Look up SourceMap of transformed source by digest of its input, returns None if not cached."""
+    entry = memory_cache.get(digest)
+    if entry is not None and entry[1] is not None:
+        return entry[1]
+    if entry is None or disk_cache is None:
+        return None
+    data = disk_cache.get(digest + '.map')
+    if data is None:
+        return None
+    source_map = sourcemap.SourceMap.from_bytes(data)
+    memory_cache.put(digest, (entry[0], source_map))
+    return source_map
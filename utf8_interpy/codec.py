@@ -1,8 +1,11 @@
 """Codec to be used as a Python source file encoding (only)."""
 import codecs
 from io import BytesIO
+from . import cache
 from . import compat
+from . import instrument
 from . import preprocessor
+from . import sourcemap
 
 encoding_name    = 'utf8-interpy'
 encoding_aliases = ['utf8_interpy', 'utf8interpy']
@@ -19,15 +22,37 @@ _Utf8IncrementalEncoder = codecs.getincrementalencoder(encoding_base)
 _Utf8StreamReader = codecs.getreader(encoding_base)
 _Utf8StreamWriter = codecs.getwriter(encoding_base)
 
-# Interactive debugger helper
-# >>> from utf8_interpy.codec import transform_bytes_string; _s = lambda input: eval(transform_bytes_string(b'"' + input.encode('utf-8') + b'"'))
+# Counters of how often pre-processing actually ran, and how often 
+# it was skipped because the input couldn't contain any interpolations
+stats = {'preprocessed': 0, 'fast_path': 0}
+
+# Interactive debugger helper; see utf8_interpy.template
+# >>> from utf8_interpy import interpolate as _s
 # >>> test = 'foobar'
 # >>> _s("#{test}")
 # 'foobar'
 
-def transform_bytes_stream(stream):
-    """Transform bytes stream to bytes string."""
+def _preprocess_instrumented(tokens, untokenize, record, source_map=None):
+    # same as untokenize(preprocess_tokens(tokens)), but timing each stage separately
+    t0 = instrument.clock()
+    tokens = list(tokens)
+    t1 = instrument.clock()
+    tokens_out = list(preprocessor.preprocess_tokens(tokens, record, source_map))
+    t2 = instrument.clock()
+    data = untokenize(tokens_out)
+    t3 = instrument.clock()
+    record['tokens'] += len(tokens)
+    record['tokenize'] += t1 - t0
+    record['rewrite'] += t2 - t1
+    record['untokenize'] += t3 - t2
+    return data
+
+def transform_bytes_stream(stream, record=None):
+    """Transform bytes stream to bytes string; optionally collecting figures in record (see instrument.py)."""
+    stats['preprocessed'] += 1
     try:
+        if record is not None:
+            return _preprocess_instrumented(compat.tokenize(stream.readline), compat.untokenize, record)
         return compat.untokenize(preprocessor.tokenize_and_preprocess(stream.readline))
         #return compat.untokenize(compat.tokenize(stream.readline)) # XXX: debug, pass-through without pre-processing
     except Exception as e:
@@ -38,80 +63,307 @@ def transform_bytes_stream(stream):
         stream.seek(0) # rewind to start of stream
         return stream.read()
 
-def transform_bytes_string(input):
+def transform_bytes_string(input, record=None):
     """Transform bytes string to bytes string."""
+    if not preprocessor.may_interpolate(input):
+        stats['fast_path'] += 1
+        return input
     stream = BytesIO(input)
-    return transform_bytes_stream(stream)
-
-def _transform_as_utf8_encoded(stream):
-    """Transform bytes stream to bytes string, 
-    forcing encoding during transformation to be UTF-8 if  
-    '# coding: utf8-interpy' cookie is found, to avoid 
-    circular dependencies."""
-    # Because our transform uses tokenize.tokenize() on Py3, which internally calls 
-    # decode() of the codec specified in the '# coding: xyz' cookie, we should avoid 
-    # the case where this codec is 'utf8-interpy' because utf8_interpy's decode() again 
-    # calls transform, which calls tokenize, which calls decode, which calls transform, 
-    # etc.
-    # As a work-around, we here read the 'coding' cookie and if it is 'utf8-interpy', 
-    # we transform the string without the cookie, which will cause tokenize to consider 
-    # it to have the default utf-8 encoding; finally we re-add the cookie string to the 
-    # beginning of the transformed output.
-
-    encoding, lns = compat.detect_encoding(stream.readline)
-    head = b''.join(lns)
+    return transform_bytes_stream(stream, record)
 
-    if encoding == encoding_name or encoding in encoding_aliases:
-        data = stream.read()           # transform without encoding cookie
-        data = transform_bytes_string(data)
-        #head = head.replace(b'utf8-interpy', b'utf-8')	# change to utf-8 encoding, to avoid 'unknown encoding' error in some IDE's (e.g. PTVS 2.1, 2.2RC)
-        data = head + data             # reconstruct transformed output
-    else:
-        data = head + stream.read()    # tranform with first (non-cookie) line
-        data = transform_bytes_string(data)
+def transform_text(text, record=None, source_map=None):
+    """Transform source text (already decoded) to text; optionally 
+    adding column shifts to source_map (see sourcemap.py)."""
+    # Tokenizing bytes with tokenize.tokenize() on Py3 calls decode() of the codec 
+    # in the '# coding: xyz' cookie, i.e. of this codec, which would transform again, 
+    # etc.; tokenizing text doesn't look at the cookie at all, so the cookie 
+    # line is simply passed through like any other comment. 
+    # It also avoids encoding the output only to decode it again right after.
+    stats['preprocessed'] += 1
+    try:
+        tokens = compat.generate_tokens(preprocessor.text_readline(text))
+        if record is not None:
+            return _preprocess_instrumented(tokens, compat.untokenize_text, record, source_map)
+        return compat.untokenize_text(preprocessor.preprocess_tokens(tokens, None, source_map))
+    except Exception as e:
+        # on any kind of error, we simply output the input without transformation and let the interpreter inform user
+        print('Unhandled exception applying UTF8-Interpy pre-processing!')
+        print(e)
+        if source_map is not None:
+            source_map.clear() # untransformed, so no column shifts
+        return text
 
-    return data
+def transform_source_text(input, errors='strict'):
+    """Decode bytes string (or memoryview) of a source file and transform it to text, 
+    looking up the result in the transform cache first."""
+    record = instrument.new_record(input) if instrument.enabled else None
+    if not preprocessor.may_interpolate(input):
+        stats['fast_path'] += 1
+        text = _utf8_decode(input, errors)[0]
+        if record is not None:
+            record['fast_path'] = True
+            instrument.finish_record(record, text)
+        return text                    # nothing to transform, also not worth caching
+    digest = cache.source_digest(input)
+    text = cache.get(digest)
+    if text is None:
+        source_map = sourcemap.SourceMap()
+        text = transform_text(_utf8_decode(input, errors)[0], record, source_map)
+        if errors == 'strict':         # otherwise, input might not have been valid UTF-8
+            cache.put(digest, text, source_map)
+    elif record is not None:
+        record['cache_hit'] = True
+    if record is not None:
+        instrument.finish_record(record, text)
+    return text
+
+def transform_source_map(input):
+    """Transform bytes string of a source file to text like transform_source_text(), 
+    also returning the SourceMap from transformed to original columns."""
+    if not preprocessor.may_interpolate(input):
+        return _utf8_decode(input)[0], sourcemap.SourceMap()
+    digest = cache.source_digest(input)
+    text = cache.get(digest)
+    source_map = cache.get_source_map(digest)
+    if text is None or source_map is None:
+        source_map = sourcemap.SourceMap()
+        text = transform_text(_utf8_decode(input)[0], None, source_map)
+        cache.put(digest, text, source_map)
+    return text, source_map
+
+def transform_source(input):
+    """Transform bytes string of a source file to bytes string, 
+    like transform_source_text(), but encoded as UTF-8."""
+    if not preprocessor.may_interpolate(input):
+        stats['fast_path'] += 1
+        if instrument.enabled:
+            record = instrument.new_record(input)
+            record['fast_path'] = True
+            instrument.finish_record(record, input)
+        return input                   # nothing to transform
+    return transform_source_text(input).encode('utf-8')
+
+
+def has_interpy_cookie(path):
+    """Check if source file starts with a '# coding: utf8-interpy' cookie."""
+    try:
+        with open(path, 'rb') as f:
+            encoding, lns = compat.detect_encoding(f.readline)
+    except (IOError, OSError, SyntaxError):
+        return False
+    return encoding == encoding_name or encoding in encoding_aliases
+
+def is_interpy_source(input):
+    """Check if bytes string of a source file starts with a '# coding: utf8-interpy' cookie."""
+    try:
+        encoding, lns = compat.detect_encoding(BytesIO(input).readline)
+    except SyntaxError:
+        return False
+    return encoding == encoding_name or encoding in encoding_aliases
 
 
 # Stateless encoding and decoding functions
 interpy_encode = _utf8_encode                           # just use utf8
 
 def interpy_decode(input, errors='strict'):
-    # when importing a file in Py3, input will be a memoryview, 
-    # but BytesIO takes this fine, so no need to do input.tobytes()
-    stream = BytesIO(input)
-    input = _transform_as_utf8_encoded(stream)
-    return _utf8_decode(input, errors)
+    # when importing a file in Py3, input will be a memoryview, which is decoded 
+    # directly; hashlib and the regular expressions of the fast path take it as well
+    return transform_source_text(input, errors), len(input)
+
+# Sizes of sources transformed by IncrementalTransformer, by digest of the first chunk of their input
+_source_sizes = cache.MemoryCache()
+
+class IncrementalTransformer(object):
+    """Transforms source bytes incrementally, a number of complete statements (logical lines) 
+    at a time, so memory use is bounded by the largest statement rather than by the source size.
+
+    Sources read before (e.g. by linecache, every time a traceback is printed) are recognized by 
+    the first chunk of input; these are held until the end of the input instead, and transformed 
+    all at once, using the transform cache (which the transform of a source streamed before is 
+    stored in, if it isn't larger than max_cached_size)."""
+
+    max_cached_size = 1024*1024         # in bytes of input
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self._indents = []              # indentation levels at start of pending input
+        self._started = False           # part of the input has been transformed already
+        self._retry_size = 0            # don't look for end of statement again until this much input is pending
+        self._first_digest = None       # digest of the first (non-empty) input
+        self._hold_size = 0             # size of the source read before, which started with that input
+        self._done = False              # final input has been transformed
+        self._size = 0                  # number of input bytes transformed
+        self._output_size = 0           # (and of output bytes)
+        self._input = []                # input and transformed output, while at most max_cached_size
+        self._output = []
+        self._record = None             # (see instrument.py)
+        self._elapsed = 0.0
+
+    def transform(self, input, final=False):
+        """Transform as much of bytes string input as possible; returns 
+        transformed bytes string and number of input bytes consumed."""
+        if self._done and not input:
+            return b'', 0               # e.g. TextIOWrapper decodes again at end of input
+        if not self._started:
+            if self._first_digest is None and input:
+                self._first_digest = cache.source_digest(input)
+                self._hold_size = _source_sizes.get(self._first_digest) or 0
+            if final:
+                if input and len(input) <= self.max_cached_size:
+                    _source_sizes.put(self._first_digest, len(input))
+                self._done = True
+                return transform_source(input), len(input)  # all at once, using the transform cache
+            if len(input) <= self._hold_size:
+                return b'', 0
+        if final:
+            end, indents = len(input), self._indents
+        else:
+            if len(input) < self._retry_size:
+                return b'', 0
+            end, indents = preprocessor.find_last_statement_end(input, self._indents)
+            if end == 0:
+                # wait for input to double before tokenizing it again, 
+                # so a large statement arriving in small chunks isn't quadratic
+                self._retry_size = 2 * len(input)
+                return b'', 0
+            self._retry_size = 0
+
+        # transform statements with a preamble restoring the indentation they start at;
+        # this also keeps tokenize from seeing the encoding cookie on the first chunk
+        if instrument.enabled and self._record is None:
+            self._record = instrument.new_record(input)
+        t0 = instrument.clock()
+        preamble = preprocessor.indentation_preamble(self._indents)
+        data = transform_bytes_string(preamble + input[:end], self._record)[len(preamble):]
+        self._elapsed += instrument.clock() - t0
+        self._indents = indents
+        self._started = True
+        self._size += end
+        self._output_size += len(data)
+        if self._input is not None and self._size <= self.max_cached_size:
+            self._input.append(input[:end])
+            self._output.append(data)
+        if final:
+            self._finish()
+            self._done = True
+        return data, end
+
+    def _finish(self):
+        # cache the transform of the whole source (see transform_source_text()), and record it
+        if self._input is not None and self._size <= self.max_cached_size:
+            input = b''.join(self._input)
+            if preprocessor.may_interpolate(input):
+                try:
+                    cache.put(cache.source_digest(input), b''.join(self._output).decode('utf-8'))
+                except UnicodeDecodeError:
+                    pass # not valid UTF-8; decoding will fail (or not, depending on errors)
+                else:
+                    _source_sizes.put(self._first_digest, self._size)
+        if self._record is not None:
+            self._record['bytes_in'] = self._size
+            self._record['bytes_out'] = self._output_size
+            self._record['fast_path'] = self._record['tokens'] == 0 # (no statements needed transforming)
+            self._record['total'] = instrument.clock() - self._elapsed # (only the time spent transforming)
+            instrument.finish_record(self._record)
+        self._input, self._output, self._record = [], [], None
+
+    def getstate(self):
+        """Return (hashable) state to continue transforming input from, 
+        given to setstate() when the same input is transformed again."""
+        return (tuple(self._indents), self._started, self._retry_size, self._first_digest, 
+                self._hold_size, self._done, self._size, self._output_size)
+
+    def setstate(self, state):
+        indents, self._started, self._retry_size, self._first_digest, \
+            self._hold_size, self._done, self._size, self._output_size = state
+        self._indents = list(indents)
+        self._input = self._output = None   # input transformed since isn't known, so don't cache it
 
 # Incremental encoder and decoder
 # Note:
-# Because our decoder uses tokenize, we need the entire input before we 
-# can decode (even tokenizing line-by-line doesn't work properly for 
-# multi-line statements, multi-line strings, etc.).
+# Because our decoder uses tokenize, it can only decode complete statements; 
+# input is buffered until the end of a logical line (e.g. not inside brackets 
+# or multi-line strings) is received.
 InterpyIncrementalEncoder = _Utf8IncrementalEncoder     # just use utf8
 
 class InterpyIncrementalDecoder(_Utf8IncrementalDecoder):
     def __init__(self, errors='strict'):
         _Utf8IncrementalDecoder.__init__(self, errors)
+        self._transformer = IncrementalTransformer()
+        # TextIOWrapper.tell() and seek() restore a state returned by getstate() and decode 
+        # (part of) the input again; its flags are a small int (part of a tell() cookie), 
+        # so these refer to transformer states kept here, the initial state being 0
+        self._states = [self._transformer.getstate()]
+        self._state_flags = {self._states[0]: 0}
 
     def _buffer_decode(self, input, errors, final):
-        if not final:
-            #stream = BytesIO(input)
-            #line = stream.readline()
-            #if b'\n' in line:
-            #    return interpy_decode(line, errors) # decode single line
-            #else:
-            #    return u'', 0                       # wait until we have received at least one full line
-            return u'', 0                           # wait until we have received entire input
-        else:
-            return interpy_decode(input, errors)    # decode all remaining
+        data, consumed = self._transformer.transform(input, final)
+        return _utf8_decode(data, errors)[0], consumed
+
+    def reset(self):
+        _Utf8IncrementalDecoder.reset(self)
+        self._transformer.reset()
+
+    def getstate(self):
+        state = self._transformer.getstate()
+        flags = self._state_flags.get(state)
+        if flags is None:
+            flags = self._state_flags[state] = len(self._states)
+            self._states.append(state)
+        return self.buffer, flags
+
+    def setstate(self, state):
+        self.buffer = state[0]
+        self._transformer.setstate(self._states[state[1]])
+
+class _TransformingStream(object):
+    """Wraps bytes stream, transforming it while being read."""
+
+    chunk_size = 64*1024
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._transformer = IncrementalTransformer()
+        self._pending = b''             # input not transformed yet
+        self._output = b''              # transformed, but not read yet
+        self._eof = False
+
+    def read(self, size=-1):
+        if size is None:
+            size = -1
+        while not self._eof and (size < 0 or len(self._output) < size):
+            if size < 0:
+                data = self._stream.read()
+                self._eof = True        # read all at once
+            else:
+                data = self._stream.read(max(size, self.chunk_size))
+                self._eof = not data
+            self._pending += data
+            data, consumed = self._transformer.transform(self._pending, self._eof)
+            self._pending = self._pending[consumed:]
+            self._output += data
+        if size < 0:
+            size = len(self._output)
+        data, self._output = self._output[:size], self._output[size:]
+        return data
+
+    def seek(self, offset, whence=0):
+        if offset != 0 or whence != 0:
+            raise IOError('utf8-interpy stream can only be rewound to start')
+        self._stream.seek(0)
+        self.__init__(self._stream)
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
 
 # Stream reader and writer
 InterpyStreamWriter = _Utf8StreamWriter                 # just use utf8
 
 class InterpyStreamReader(_Utf8StreamReader):
     def __init__(self, stream, errors='strict'):
-        stream = BytesIO(_transform_as_utf8_encoded(stream))        # transform input stream (all at once)
+        stream = _TransformingStream(stream)                        # transform input stream (while reading)
         _Utf8StreamReader.__init__(self, stream, errors)            # pass onto UTF-8 stream reader
 
 
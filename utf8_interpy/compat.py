@@ -1,13 +1,26 @@
 """Py2/Py3 compatibility helpers for the tokenize module."""
+import itertools
+import os
 import sys
 import tokenize as pytokenize
 
 # text type as string
 if sys.version_info.major >= 3:
     text_type_str = 'str'
+    text_type = str
+    integer_types = (int,)
 else:
     text_type_str = 'unicode'
     #text_type_str = 'str'     # change to use non-unicode text on Py2
+    text_type = unicode
+    integer_types = (int, long)
+
+# f-string support
+has_fstrings = sys.version_info >= (3, 6)
+fstring_allows_backslash = sys.version_info >= (3, 12) # PEP 701; also allows '#' (not comments) inside expressions
+
+# module __getattr__ (PEP 562)
+has_module_getattr = sys.version_info >= (3, 7)
 
 # tokenize.TokenInfo
 if sys.version_info.major >= 3:
@@ -53,5 +66,63 @@ else:
         # convert to bytes string
         return pytokenize.untokenize(tokens).encode('utf-8')
 
+# tokenize.generate_tokens() and tokenize.untokenize() of text (str on Py3, unicode on Py2);
+# no encoding is detected or applied, and without an ENCODING token untokenize() returns text
+generate_tokens = pytokenize.generate_tokens
+
+def untokenize_text(tokens):
+    # Untokenizer collects every token and bit of whitespace as separate small strings until 
+    # the end, which takes many times the size of the source; join these for each logical line
+    untokenizer = pytokenize.Untokenizer()
+    lines = []
+    def join_lines(tokens):
+        for token in tokens:
+            yield token
+            if token[0] == pytokenize.NEWLINE:
+                lines.append(u''.join(untokenizer.tokens))
+                del untokenizer.tokens[:]
+    lines.append(untokenizer.untokenize(join_lines(tokens)))
+    return u''.join(lines)
+
+# os.replace()
+try:
+    replace_file = os.replace
+except AttributeError:
+    def replace_file(src, dst):
+        # Py2 os.rename() is atomic on POSIX, but fails on Windows when dst exists
+        try:
+            os.rename(src, dst)
+        except OSError:
+            if not os.path.exists(dst):
+                raise
+            os.remove(src) # dst was written concurrently by someone else, keep theirs
+
+# functools.lru_cache()
+try:
+    from functools import lru_cache
+except ImportError:
+    def lru_cache(maxsize=128):
+        # minimal Py2 version; single hashable argument, no cache_info()
+        from collections import OrderedDict
+        def decorator(fun):
+            memo = OrderedDict()
+            def cached(arg):
+                try:
+                    value = memo.pop(arg)
+                except KeyError:
+                    value = fun(arg)
+                    if maxsize is not None and len(memo) >= maxsize > 0:
+                        memo.popitem(last=False)
+                if maxsize != 0:
+                    memo[arg] = value # (re)insert as most recently used
+                return value
+            cached.cache_clear = memo.clear
+            return cached
+        return decorator
+
+# lazy map() and zip()
+imap = getattr(itertools, 'imap', map)
+izip = getattr(itertools, 'izip', zip)
+
 # contents of module
-__all__ = [text_type_str, TokenInfo, detect_encoding, tokenize, untokenize]
+__all__ = [text_type_str, text_type, integer_types, has_fstrings, fstring_allows_backslash, has_module_getattr, TokenInfo, detect_encoding, tokenize, untokenize, generate_tokens, untokenize_text, replace_file, lru_cache, imap, izip]
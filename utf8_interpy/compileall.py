@@ -0,0 +1,89 @@
+"""Pre-process and byte-compile all utf8-interpy source files in directory trees,
+so that importing them doesn't need to run the codec (e.g. when baking container images).
+
+Usage: python -m utf8_interpy.compileall [-j WORKERS] [-f] [-q] PATH [PATH ...]
+"""
+from __future__ import absolute_import
+import argparse
+import os
+import sys
+import time
+from . import bytecode
+from . import codec
+
+def find_sources(paths):
+    """Find .py files in given files and directory trees."""
+    for path in paths:
+        if os.path.isdir(path):
+            for dirpath, dirnames, filenames in os.walk(path):
+                dirnames[:] = sorted(d for d in dirnames if d != '__pycache__' and not d.startswith('.'))
+                for filename in sorted(filenames):
+                    if filename.endswith('.py'):
+                        yield os.path.join(dirpath, filename)
+        else:
+            yield path
+
+def compile_file(path, force=False):
+    """Pre-process and byte-compile a single source file, if it uses the utf8-interpy encoding.
+
+    Returns tuple of path, status ('compiled', 'up-to-date', 'skipped' or 'error'),
+    time spent in seconds, and error message (or None)."""
+    t0 = time.time()
+    try:
+        if not codec.has_interpy_cookie(path):
+            return path, 'skipped', time.time() - t0, None
+        st = os.stat(path)
+        pyc_path = bytecode.cache_path(path)
+        if not force and bytecode.check_pyc(pyc_path, st.st_mtime, st.st_size):
+            return path, 'up-to-date', time.time() - t0, None
+        with open(path, 'rb') as f:
+            data = codec.transform_source(f.read())
+        code = bytecode.compile_source(data, path)
+        bytecode.write_pyc(pyc_path, code, st.st_mtime, st.st_size, st.st_mode & 0o666)
+    except (IOError, OSError, SyntaxError, ValueError) as e:
+        return path, 'error', time.time() - t0, '%s: %s' % (type(e).__name__, e)
+    return path, 'compiled', time.time() - t0, None
+
+def compile_tree(paths, workers=None, force=False):
+    """Pre-process and byte-compile source files in given files and directory trees,
+    using a pool of worker processes (workers=1 compiles in the current process).
+
+    Generates the results of compile_file(), as soon as each file is done."""
+    sources = list(find_sources(paths))
+    if workers != 1:
+        try:
+            from concurrent.futures import ProcessPoolExecutor, as_completed
+        except ImportError:
+            workers = 1 # Py2 without 'futures' backport
+    if workers == 1 or len(sources) <= 1:
+        for path in sources:
+            yield compile_file(path, force)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(compile_file, path, force) for path in sources]
+        for future in as_completed(futures):
+            yield future.result()
+
+def main(args=None):
+    parser = argparse.ArgumentParser(prog='python -m utf8_interpy.compileall', description='Pre-process and byte-compile utf8-interpy source files.')
+    parser.add_argument('paths', metavar='PATH', nargs='+', help='source file or directory tree')
+    parser.add_argument('-j', '--workers', type=int, default=None, help='number of worker processes (default: number of CPUs)')
+    parser.add_argument('-f', '--force', action='store_true', help='compile even if .pyc files are up-to-date')
+    parser.add_argument('-q', '--quiet', action='store_true', help='only report errors and summary')
+    args = parser.parse_args(args)
+
+    t0 = time.time()
+    counts = {'compiled': 0, 'up-to-date': 0, 'skipped': 0, 'error': 0}
+    for path, status, seconds, message in compile_tree(args.paths, args.workers, args.force):
+        counts[status] += 1
+        if status == 'error':
+            print('%9.1f ms  %-10s %s: %s' % (seconds * 1000, status, path, message))
+        elif status != 'skipped' and not args.quiet:
+            print('%9.1f ms  %-10s %s' % (seconds * 1000, status, path))
+    print('%d compiled, %d up-to-date, %d errors (%d files without utf8-interpy cookie skipped) in %.2f s' %
+        (counts['compiled'], counts['up-to-date'], counts['error'], counts['skipped'], time.time() - t0))
+    return 1 if counts['error'] else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
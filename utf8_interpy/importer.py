@@ -0,0 +1,77 @@
+"""Import hook for utf8-interpy source files; an alternative to decoding them through the codec (Py3.4+ only).
+
+>>> import utf8_interpy.importer
+>>> utf8_interpy.importer.install()
+
+Modules whose source starts with a '# coding: utf8-interpy' cookie are loaded by InterpyLoader,
+which transforms the raw source bytes once and compiles the result directly. Compiled code
+is cached in .pyc files tagged with the pre-processor version (e.g. 'foo.cpython-311.interpy-1.3.0.pyc'),
+so these are invalidated whenever the transform changes (options which change the generated code
+are part of the tag too, e.g. 'interpy-1.3.0-memo-safe'). All other modules are loaded as usual.
+"""
+import sys
+
+if sys.version_info < (3, 4):
+    raise ImportError('utf8_interpy.importer requires Python 3.4+')
+
+import importlib.machinery
+from . import bytecode
+from . import codec
+from . import incremental
+from . import preprocessor
+
+def pyc_tag():
+    """Tag of .pyc files of transformed modules, for the current pre-processor options."""
+    tag = preprocessor.options_tag()
+    return 'interpy-' + preprocessor.version + ('-' + tag if tag else '')
+
+class InterpyLoader(importlib.machinery.SourceFileLoader):
+    """Source file loader which pre-processes source code, and caches code in tagged .pyc files."""
+
+    def get_code(self, fullname):
+        source_path = self.get_filename(fullname)
+        st = self.path_stats(source_path)
+        pyc_path = bytecode.cache_path(source_path, pyc_tag())
+        code = bytecode.load_pyc(pyc_path, st['mtime'], st['size'])
+        if code is not None:
+            return code
+
+        code = self.source_to_code(self.get_data(source_path), source_path)
+        if not sys.dont_write_bytecode:
+            try:
+                bytecode.write_pyc(pyc_path, code, st['mtime'], st['size'])
+            except (IOError, OSError):
+                pass # e.g. read-only file system
+        return code
+
+    def source_to_code(self, data, path, *args, **kwargs):
+        if incremental.enabled:
+            return bytecode.compile_source(incremental.transform_source(path, data), path) # e.g. reloads while editing
+        return bytecode.compile_source(codec.transform_source_text(data), path)
+
+
+class InterpyFinder(object):
+    """Meta path finder which finds modules like the standard path based finder does,
+    but loads utf8-interpy source files with InterpyLoader."""
+
+    @classmethod
+    def find_spec(cls, fullname, path=None, target=None):
+        spec = importlib.machinery.PathFinder.find_spec(fullname, path, target)
+        if spec is not None and type(spec.loader) is importlib.machinery.SourceFileLoader and codec.has_interpy_cookie(spec.origin):
+            spec.loader = InterpyLoader(fullname, spec.origin)
+        return spec
+
+    @classmethod
+    def invalidate_caches(cls):
+        pass # PathFinder is invalidated separately, as it is also on sys.meta_path
+
+
+def install():
+    """Install import hook (in front of the standard path based finder)."""
+    if InterpyFinder not in sys.meta_path:
+        index = sys.meta_path.index(importlib.machinery.PathFinder) if importlib.machinery.PathFinder in sys.meta_path else len(sys.meta_path)
+        sys.meta_path.insert(index, InterpyFinder)
+
+def uninstall():
+    if InterpyFinder in sys.meta_path:
+        sys.meta_path.remove(InterpyFinder)
@@ -0,0 +1,190 @@
+"""Incremental re-transforming of source files which change a few lines at a time, e.g. by
+dev servers and hot-reload workers watching large (generated) utf8-interpy modules.
+
+>>> from utf8_interpy import incremental
+>>> text = incremental.transform_file('app/tables.py')    # full transform, the first time
+>>> text = incremental.transform_file('app/tables.py')    # after an edit, re-transforms only the changed statements
+
+Enable by setting the UTF8_INTERPY_INCREMENTAL environment variable (or incremental.enable())
+to have the import hook (see importer.py) transform modules it (re)loads this way.
+
+Pre-processing never changes line numbers, and each statement (logical line) transforms the same
+on its own, given the indentation levels it starts at (see codec.IncrementalTransformer). So the
+previous input and output lines of each file are kept, with the rows and indentation levels where
+statements start. On a change, only the lines from the start of the first changed statement up to
+the first statement after the last changed line which starts at the same indentation levels as
+before are tokenized and transformed again; all other output lines are reused. The result is the
+same as that of codec.transform_text(); setting verify checks this with a full transform (and uses
+its result, counting a mismatch in stats, if they differ).
+"""
+from bisect import bisect_left, bisect_right
+from itertools import chain, islice
+import os
+import tokenize
+from . import codec
+from . import compat
+from . import preprocessor
+
+env_incremental = 'UTF8_INTERPY_INCREMENTAL'
+
+enabled = bool(os.environ.get(env_incremental))
+verify = False
+
+stats = {'full': 0, 'incremental': 0, 'lines_transformed': 0, 'lines_reused': 0, 'mismatches': 0}
+
+_sources = {}   # path -> IncrementalSource
+
+def enable():
+    """Transform modules loaded by the import hook incrementally."""
+    global enabled
+    enabled = True
+
+def disable():
+    global enabled
+    enabled = False
+
+def split_lines(text):
+    """Split text into lines like text_readline() reads them (only after '\\n', keeping it)."""
+    lines = text.split(u'\n')
+    last = lines.pop()
+    lines = [line + u'\n' for line in lines]
+    if last:
+        lines.append(last)
+    return lines
+
+def _preamble(indents):
+    return preprocessor.indentation_preamble([indent.encode('utf-8') for indent in indents]).decode('utf-8')
+
+def statement_starts(lines, start=0, indents=()):
+    """Generate (row, indentation levels) of each statement following the one at row start of lines,
+    which starts at given indentation levels; only tokenizes lines as far as the generator is advanced.
+    Raises TokenError or SyntaxError for invalid source."""
+    # rows of statements end at NEWLINE tokens (outside brackets and multi-line strings);
+    # at that point, the DEDENTs of the next statement haven't been read yet
+    preamble = split_lines(_preamble(indents))
+    source = chain(preamble, islice(lines, start, None))
+    offset = start - len(preamble)
+    stack = []
+    depth = 0
+    for tok_type, tok_str, (srow, scol), _, _ in compat.generate_tokens(lambda: next(source, u'')):
+        if tok_type == tokenize.OP and tok_str in '([{)]}':
+            depth += 1 if tok_str in '([{' else -1
+            if depth < 0:
+                # (the pure Python tokenizer carries on, and its state then depends on all preceding tokens)
+                raise SyntaxError('unmatched %r' % tok_str)
+        elif tok_type == tokenize.INDENT:
+            stack.append(tok_str)
+        elif tok_type == tokenize.DEDENT:
+            stack.pop()
+        elif tok_type == tokenize.NEWLINE and srow > len(preamble):
+            yield srow + offset, tuple(stack)
+
+class IncrementalSource(object):
+    """Source text and its transform, kept to transform changed versions of the source incrementally."""
+
+    def __init__(self):
+        self.text = None
+        self.output = None
+        self._lines = []            # input lines
+        self._output_lines = []     # output lines (same rows)
+        self._rows = []             # rows where statements start (sorted), empty if the source can't be transformed incrementally
+        self._indents = []          # indentation levels at the start of those statements
+
+    def transform(self, text):
+        """Transform source text (like codec.transform_text()), reusing the transform of the previous text."""
+        if text == self.text:
+            return self.output
+        lines = split_lines(text)
+        result = None
+        if self._rows:
+            try:
+                result = self._transform_changed(lines)
+            except Exception:
+                result = None # e.g. invalid source while editing; the full transform reports it as usual
+        if result is None:
+            result = self._transform_full(text, lines)
+        elif verify and u''.join(result[0]) != codec.transform_text(text):
+            stats['mismatches'] += 1
+            result = self._transform_full(text, lines)
+        self._output_lines, self._rows, self._indents = result
+        self._lines = lines
+        self.text = text
+        self.output = u''.join(self._output_lines)
+        return self.output
+
+    def _transform_full(self, text, lines):
+        stats['full'] += 1
+        output_lines = split_lines(codec.transform_text(text))
+        try:
+            starts = [(0, ())] + list(statement_starts(lines))
+        except (tokenize.TokenError, SyntaxError):
+            starts = []
+        if len(output_lines) != len(lines):
+            starts = [] # (line numbers should never change)
+        return output_lines, [row for row, indents in starts], [indents for row, indents in starts]
+
+    def _transform_changed(self, lines):
+        old_lines, old_rows = self._lines, self._rows
+
+        # unchanged lines at the start and at the end
+        n = min(len(lines), len(old_lines))
+        head = 0
+        while head < n and lines[head] == old_lines[head]:
+            head += 1
+        tail = 0
+        while tail < n - head and lines[-1 - tail] == old_lines[-1 - tail]:
+            tail += 1
+        delta = len(lines) - len(old_lines)
+        changed_end = len(lines) - tail
+
+        # from the statement containing the first changed line, until a statement after the
+        # changed lines starts where one started before, at the same indentation levels
+        k = bisect_right(old_rows, head) - 1
+        start, indents = old_rows[k], self._indents[k]
+        rows, row_indents = [], []
+        end, j = len(lines), len(old_rows)
+        for row, stack in chain([(start, indents)], statement_starts(lines, start, indents)):
+            if row >= changed_end and (row == 0) == (row - delta == 0): # (the start of the source is untokenized differently)
+                i = bisect_left(old_rows, row - delta)
+                if i < len(old_rows) and old_rows[i] == row - delta and self._indents[i] == stack:
+                    end, j = row, i
+                    break
+            rows.append(row)
+            row_indents.append(stack)
+
+        # (untokenize() only reproduces the indentation of the first line like a full transform does after 
+        # a preamble, except at the start of the source, which needs no preamble when tokenizing text)
+        preamble = _preamble(indents) if start > 0 else u''
+        output = compat.untokenize_text(preprocessor.tokenize_and_preprocess_text(preamble + u''.join(lines[start:end])))
+        region_lines = split_lines(output[len(preamble):])
+        if not output.startswith(preamble) or len(region_lines) != end - start:
+            raise ValueError('line numbers changed')
+
+        stats['incremental'] += 1
+        stats['lines_transformed'] += end - start
+        stats['lines_reused'] += len(lines) - (end - start)
+        output_lines = self._output_lines[:start] + region_lines + self._output_lines[end - delta:]
+        return output_lines, old_rows[:k] + rows + [row + delta for row in old_rows[j:]], self._indents[:k] + row_indents + self._indents[j:]
+
+def transform_source(path, data):
+    """Transform bytes string of source file at path to text, like codec.transform_source_text(),
+    but reusing the transform of the previous version of the file (if any)."""
+    if not preprocessor.may_interpolate(data):
+        _sources.pop(path, None)
+        return codec.transform_source_text(data) # fast path
+    source = _sources.get(path)
+    if source is None:
+        source = _sources[path] = IncrementalSource()
+    return source.transform(codec._utf8_decode(data)[0])
+
+def transform_file(path):
+    """Read and transform source file (see transform_source())."""
+    with open(path, 'rb') as f:
+        return transform_source(path, f.read())
+
+def forget(path):
+    """Forget previous transform of source file."""
+    _sources.pop(path, None)
+
+def clear():
+    _sources.clear()
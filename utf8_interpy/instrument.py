@@ -0,0 +1,134 @@
+"""Opt-in instrumentation of pre-processing, to find out how much time imports spend in utf8_interpy.
+
+Enable by setting the UTF8_INTERPY_INSTRUMENT environment variable (a summary is printed
+to stderr at exit), or from code
+
+>>> from utf8_interpy import instrument
+>>> instrument.enable()
+>>> instrument.add_callback(print)   # called with a record dict for every source transformed
+
+Each record has the source path (if it can be determined), bytes in/out, number of tokens,
+number of interpolated string literals, seconds spent in tokenize, rewrite and untokenize
+(and in total), and whether the result came from the transform cache or the fast path.
+When disabled, the codec only checks the 'enabled' flag once per source."""
+import atexit
+import collections
+import os
+import sys
+import threading
+import time
+
+env_instrument = 'UTF8_INTERPY_INSTRUMENT'
+
+max_records = 10000     # only keep this many most recent records (totals count all)
+
+clock = getattr(time, 'perf_counter', time.time)
+
+enabled = False
+records = collections.deque(maxlen=max_records)
+totals = {}
+callbacks = []
+
+_lock = threading.Lock()
+_atexit_registered = False
+
+_counter_fields = ['sources', 'bytes_in', 'bytes_out', 'tokens', 'literals', 'tokenize', 'rewrite', 'untokenize', 'total', 'cache_hits', 'fast_path']
+
+def reset():
+    """Forget all records and totals."""
+    with _lock:
+        records.clear()
+        totals.clear()
+        totals.update((field, 0) for field in _counter_fields)
+
+reset()
+
+def enable(summary=True):
+    """Enable instrumentation; optionally print summary to stderr at exit."""
+    global enabled, _atexit_registered
+    enabled = True
+    if summary and not _atexit_registered:
+        atexit.register(_print_summary_at_exit)
+        _atexit_registered = True
+
+def disable():
+    global enabled
+    enabled = False
+
+def add_callback(callback):
+    """Call callback(record) whenever a source has been transformed."""
+    callbacks.append(callback)
+
+def remove_callback(callback):
+    callbacks.remove(callback)
+
+# functions through which the import system and our own tools pass the path of the source file
+_path_functions = frozenset(['source_to_code', 'compile_file', 'get_code'])
+
+def _source_path():
+    """Find path of the source file being decoded, by looking for it in the callers' frames."""
+    frame = sys._getframe(2)
+    depth = 0
+    while frame is not None and depth < 30:
+        if frame.f_code.co_name in _path_functions:
+            path = frame.f_locals.get('path') or frame.f_locals.get('source_path')
+            if isinstance(path, str):
+                return path
+        frame = frame.f_back
+        depth += 1
+    return None
+
+def new_record(input):
+    """Start record of transforming bytes string input."""
+    return {
+        'path': _source_path(),
+        'bytes_in': len(input),
+        'bytes_out': 0,
+        'tokens': 0,
+        'literals': 0,
+        'tokenize': 0.0,
+        'rewrite': 0.0,
+        'untokenize': 0.0,
+        'total': clock(),   # start time, until finished
+        'cache_hit': False,
+        'fast_path': False,
+    }
+
+def finish_record(record, output=None):
+    """Finish record with the transformed output (if not counted in the record already), and pass it on to callbacks."""
+    record['total'] = clock() - record['total']
+    if output is not None:
+        record['bytes_out'] = len(output)
+    with _lock:
+        records.append(record)
+        totals['sources'] += 1
+        for field in ['bytes_in', 'bytes_out', 'tokens', 'literals', 'tokenize', 'rewrite', 'untokenize', 'total']:
+            totals[field] += record[field]
+        totals['cache_hits'] += record['cache_hit']
+        totals['fast_path'] += record['fast_path']
+    for callback in list(callbacks):
+        callback(record)
+
+def summary(file=None, limit=20):
+    """Print totals, and the records of the slowest sources."""
+    if file is None:
+        file = sys.stderr
+    with _lock:
+        t = dict(totals)
+        slowest = sorted(records, key=lambda r: r['total'], reverse=True)[:limit]
+    file.write('utf8_interpy: %d sources (%d cache hits, %d fast path) in %.1f ms; tokenize %.1f ms, rewrite %.1f ms, untokenize %.1f ms; %d literals interpolated\n' %
+        (t['sources'], t['cache_hits'], t['fast_path'], t['total'] * 1000, t['tokenize'] * 1000, t['rewrite'] * 1000, t['untokenize'] * 1000, t['literals']))
+    if not slowest:
+        return
+    file.write('%10s %10s %10s %10s %9s %9s %7s %8s %-5s %s\n' % ('total ms', 'tokenize', 'rewrite', 'untokenize', 'bytes in', 'bytes out', 'tokens', 'literals', 'cache', 'path'))
+    for r in slowest:
+        file.write('%10.2f %10.2f %10.2f %10.2f %9d %9d %7d %8d %-5s %s\n' %
+            (r['total'] * 1000, r['tokenize'] * 1000, r['rewrite'] * 1000, r['untokenize'] * 1000, r['bytes_in'], r['bytes_out'], r['tokens'], r['literals'],
+             'hit' if r['cache_hit'] else ('fast' if r['fast_path'] else 'miss'), r['path'] or '<unknown>'))
+
+def _print_summary_at_exit():
+    if enabled:
+        summary()
+
+if os.environ.get(env_instrument):
+    enable()
@@ -1,131 +1,683 @@
 """Python source code pre-processor which implements Ruby-like string interpolation."""
+import ast
+from collections import deque
 from io import BytesIO
+import keyword
+import operator
+import os
+import re
+import sys
 import tokenize
 from . import compat
 
+# Version of the pre-processor output; bump whenever the generated code changes, 
+# so that cached transforms (see cache.py) are invalidated.
+version = '1.6.2'
+
+# Optional memoization of repeated expressions in a string literal (or in a group of implicitly 
+# concatenated literals), which are then evaluated only once (the group is evaluated in a function, 
+# called with its expressions as arguments); 'safe' only memoizes names and subscripts, 'all' any expression. Set through the environment
+# (any other non-empty value means 'safe'), so the option is the same for every process sharing caches.
+env_memoize = 'UTF8_INTERPY_MEMOIZE'
+memoize = {'': None, 'all': 'all'}.get(os.environ.get(env_memoize, ''), 'safe')
+
+# Lazy string literals, marked by an 'L' directly in front of the opening quotes (L"..#{x}.."), 
+# are wrapped in a function which is only called when the text is needed (see runtime.py);
+# the module is found through the package, which is imported at start-up anyway (utf8_interpy.pth)
+lazy_marker = u'L'
+if compat.has_module_getattr:
+    lazy_prefix = u"__import__('utf8_interpy').runtime.LazyString(lambda:"
+else:
+    lazy_prefix = u"__import__('utf8_interpy.runtime').runtime.LazyString(lambda:"
+_group_prefix_tokens = {}       # (see _tokenize_group_prefix())
+
+# Expressions of only literals (e.g. #{1024*1024}, #{'-' * 80}) are evaluated when pre-processing, 
+# and their text inlined into the literal, if it's at most this many characters; 0 disables folding
+fold_max_size = 256
+_default_fold_max_size = fold_max_size
+
+def options_tag():
+    """Text identifying options which change the generated code (part of cache keys and .pyc tags); '' if none."""
+    tags = []
+    if memoize:
+        tags.append('memo-' + memoize)
+    if fold_max_size != _default_fold_max_size:
+        tags.append('fold-%d' % fold_max_size)
+    return '-'.join(tags)
+
 # scan left-to-right
 #   find opening tag #{
-#   find corresponding closing tag }; exception if none found
+#   find corresponding closing tag }, skipping nested {..} and string literals; 
+#   warning if none found
 #   store begin/end column pairs
 #
 # 'xyz #{foobar} xyz' -> b = 4, e = 13
 # 'xyz '+str(foobar)+' xyz'
-def interpolate_string(s):
+_re_expr_special = re.compile(r'[{}\n\'"]')     # characters the scanner has to look at inside #{ .. }
+_re_nested_string = {                           # (single line) string literals nested inside #{ .. }
+    "'": re.compile(r"'(?:[^'\\\n]|\\.)*'"),
+    '"': re.compile(r'"(?:[^"\\\n]|\\.)*"'),
+}
+
+def find_interpolations(s):
+    """Find begin/end index pairs of #{..} tags in string literal."""
     be_pairs = []
 
-    # find matching #{ .. } tags
+    # find matching #{ .. } tags, jumping from one special character to the next
     stag = '#{'
-    etag = '}'
-    pos = 0
+    pos = s.find(stag)
     while pos != -1:
+        b = pos
+        level = 1
+        pos += len(stag)
+        while level > 0:
+            m = _re_expr_special.search(s, pos)
+            if m is None:
+                print('Warning: Interpy opening tag found, but no matching closing tag (end of string).')
+                return be_pairs
+            c = m.group()
+            pos = m.end()
+            if c == '{':
+                level += 1
+            elif c == '}':
+                level -= 1
+                if level == 0:
+                    be_pairs.append((b, pos))
+            elif c == '\n':
+                print('Warning: Interpy opening tag found, but no matching closing tag (newline).')
+                break
+            else:
+                # skip braces inside string literal; 
+                # an unterminated quote is just treated as any other character
+                m = _re_nested_string[c].match(s, m.start())
+                if m is not None:
+                    pos = m.end()
         pos = s.find(stag, pos)
-        if pos != -1:
-            b = pos
-            level = 1
-            pos += len(stag)
-            while pos < len(s):
-                if s[pos] == '{':
-                    level += 1
-                elif s[pos] == '}':
-                    level -= 1
-                    if level == 0:
-                        e = pos+1
-                        be_pairs.append((b, e))
-                        break
-                elif s[pos] == '\n':
-                    print('Warning: Interpy opening tag found, but no matching closing tag (newline).')
-                    break
-                pos += 1
-        if pos >= len(s):
-            print('Warning: Interpy opening tag found, but no matching closing tag (end of string).')
-            break
+
+    return be_pairs
+
+_re_field_special = re.compile(r'[()\[\]{}\'"!:]')   # characters split_field() has to look at
+_re_conversion    = re.compile(r'[rsa](?=:|$)')
+_re_field_suffix  = re.compile(r'(?:!([rsa]))?(?::(.*))?$', re.S)
+
+def split_field(field):
+    """Split expression inside #{..} tag into the expression, and a conversion and/or format spec suffix
+    (starting at a '!' or ':' outside brackets and nested strings, which is not part of '!=' or ':=')."""
+    # 'x!r:>10' -> ('x', '!r:>10'); 'x:.3f' -> ('x', ':.3f'); 'd[1:2] != y' -> ('d[1:2] != y', '')
+    depth = 0
+    pos = 0
+    while True:
+        m = _re_field_special.search(field, pos)
+        if m is None:
+            return field, u''
+        c = m.group()
+        pos = m.end()
+        if c in '([{':
+            depth += 1
+        elif c in ')]}':
+            depth -= 1
+        elif c in '\'"':
+            m_string = _re_nested_string[c].match(field, m.start())
+            if m_string is not None:
+                pos = m_string.end()
+        elif depth == 0 and field[pos:pos+1] != '=' and (c == ':' or _re_conversion.match(field, pos)):
+            return field[:m.start()], field[m.start():]
+
+def split_string(s):
+    """Split double quoted string literal into its quotes, and a list of alternating text and expression parts."""
+    # '"pre#{foo}mid#{bar}post"' -> '"', ['pre', 'foo', 'mid', 'bar', 'post']
 
     # get type of quotes used (single or triple)
     if len(s) >= 7 and s[0:3] == '"""' and s[-3:] == '"""':
-        oquotes = '"""'
-        cquotes = '"""'
+        quotes = '"""'
     else:
         assert(len(s) >= 3 and s[0] == '"' and s[-1] == '"')
-        oquotes = '"'
-        cquotes = '"'
+        quotes = '"'
 
-    # replace string tags with interpolation expressions
-    s_out = ''
+    parts = []
     pos = 0
-    for b, e in be_pairs:
-        s_out += s[pos:b] # lhs
-#        s_out += cquotes + '+' + compat.text_type_str + '(' + unescape_quotes(s[b+len(stag):e-len(etag)]) + ')+' + oquotes # interpolation
-        s_out += cquotes + '+' + compat.text_type_str + '(' + s[b+len(stag):e-len(etag)] + ')+' + oquotes # interpolation
+    for b, e in find_interpolations(s):
+        parts.append(s[pos:b])      # lhs
+        parts.append(s[b+2:e-1])    # expression inside #{ .. }
         pos = e
-    s_out += s[pos:] # final rhs
-    # Note:
-    # Above code is not optimal in the sense of generating the most compact expression, 
-    # and will generate some superfluous ..+""+.. type code.
-    # E.g.
-    # in:  '"#{foobar}#{foobar}"'
-    # out: '""+str(foobar)+""+str(foobar)+""'
-    # opt: 'str(foobar)+str(foobar)'
+    parts.append(s[pos:])           # final rhs
+
+    # strip quotes from first and last text part
+    parts[0] = parts[0][len(quotes):]
+    parts[-1] = parts[-1][:-len(quotes)]
+    return quotes, parts
+
+_re_fstring_text    = re.compile(r'\\N\{[^}]*\}|\\[^{}]|[{}]', re.S)   # escapes (skipped), and braces (doubled) in f-string text
+_re_fstring_special = re.compile(r'[!:={}]')                        # characters with a special meaning in f-string replacement fields
+
+def _escape_fstring_text(text):
+    return _re_fstring_text.sub(lambda m: m.group() * 2 if len(m.group()) == 1 else m.group(), text)
+
+def format_fstring(quotes, parts):
+    """Build f-string literal from text and expression parts (see split_string()); 
+    returns None if f-strings are not supported or an expression cannot be embedded in an f-string."""
+    # '"', ['pre', 'foo', '{mid}', 'bar', 'post'] -> 'f"pre{foo}{{mid}}{bar}post"'
+    if not compat.has_fstrings:
+        return None
+
+    s_out = ['f', quotes, _escape_fstring_text(parts[0])]
+    for i in range(1, len(parts), 2):
+        expr, suffix = split_field(parts[i])
+        if not expr.strip():
+            return None # empty expression is not allowed
+        if not compat.fstring_allows_backslash and ('\\' in parts[i] or '#' in expr):
+            return None
+        if _re_fstring_special.search(expr):
+            expr = '(' + expr + ')' # e.g. don't interpret ':=' or '!=' as conversion or format spec
+        s_out += ['{', expr, suffix, '}', _escape_fstring_text(parts[i+1])]
+    s_out.append(quotes)
+
+    return ''.join(s_out)
+
+def _is_text_literal(tokens):
+    """Check if expression tokens are (implicitly concatenated) text string literals, which need no str() conversion."""
+    for tok_type, tok_str, scol, ecol in tokens:
+        if tok_type != tokenize.STRING:
+            return False
+        prefix = tok_str[:tok_str.find(tok_str[-1])].lower()
+        if 'b' in prefix or (sys.version_info.major < 3 and 'u' not in prefix):
+            return False
+    return len(tokens) > 0
+
+def _has_toplevel_comma(tokens):
+    depth = 0
+    for tok_type, tok_str, scol, ecol in tokens:
+        if tok_type == tokenize.OP:
+            if tok_str in '([{':
+                depth += 1
+            elif tok_str in ')]}':
+                depth -= 1
+            elif tok_str == ',' and depth == 0:
+                return True
+    return False
+
+def _parenthesize_expression(expr, tokens):
+    tokens = [(tokenize.OP, u'(', 0, 1)] + [(tok_type, tok_str, scol+1, ecol+1) for tok_type, tok_str, scol, ecol in tokens] + [(tokenize.OP, u')', len(expr)+1, len(expr)+2)]
+    return '(' + expr + ')', tokens
+
+_conversion_functions = {'s': compat.text_type_str, 'r': 'repr', 'a': 'ascii' if sys.version_info.major >= 3 else 'repr'}
+
+def _format_spec_expression(quotes, spec):
+    # ':>{width}' -> '(">"+str(width))'
+    pieces = re.split(r'\{([^{}]*)\}', spec) # nested replacement fields
+    if len(pieces) == 1:
+        return quotes + spec + quotes
+    operands = [quotes + piece + quotes if k % 2 == 0 else u'%s(%s)' % (compat.text_type_str, piece) for k, piece in enumerate(pieces) if piece]
+    return u'(' + u'+'.join(operands) + u')'
+
+def format_field(quotes, expr, suffix):
+    """Expression which converts and formats the value of expression according to conversion and 
+    format spec suffix (see split_field()), like a replacement field of an f-string does."""
+    # '"', 'x', '!r:>10' -> 'format(repr(x), ">10")'
+    conversion, spec = _re_field_suffix.match(suffix).groups()
+    if conversion:
+        expr = u'%s(%s)' % (_conversion_functions[conversion], expr)
+    if spec is not None:
+        expr = u'format(%s, %s)' % (expr, _format_spec_expression(quotes, spec))
+    return expr
+
+_re_literal_special = re.compile(u'[\\\\"\'\x00-\x1f\x7f]')   # characters to escape in text of string literal
+
+def escape_literal_text(text):
+    """Escape text, so it can be part of the text of a (non-raw) string literal."""
+    return _re_literal_special.sub(lambda m: u'\\' + m.group() if m.group() in u'\\"\'' else u'\\x%02x' % ord(m.group()), text)
+
+_fold_token_types = frozenset([tokenize.NUMBER, tokenize.STRING, tokenize.OP])
+_fold_names = {'True': True, 'False': False, 'None': None} # (names on Py2)
+_fold_unary_operators = {'UAdd': operator.pos, 'USub': operator.neg, 'Invert': operator.invert}
+_fold_binary_operators = {'Add': operator.add, 'Sub': operator.sub, 'Mult': operator.mul, 'Div': operator.truediv, 
+                          'FloorDiv': operator.floordiv, 'Mod': operator.mod, 'Pow': operator.pow}
+_fold_sequence_types = (compat.text_type, bytes, tuple, list)
+_fold_conversions = {'s': compat.text_type, 'r': repr, 'a': ascii if sys.version_info.major >= 3 else repr}
+_fold_literal_fields = {'Constant': 'value', 'NameConstant': 'value', 'Num': 'n', 'Str': 's', 'Bytes': 's'}
+
+def _is_constant_expression(tokens):
+    """Check if expression tokens are only literals, operators and True, False or None (not f-strings)."""
+    for tok_type, tok_str, scol, ecol in tokens:
+        if tok_type == tokenize.NAME:
+            if tok_str not in _fold_names:
+                return False
+        elif tok_type not in _fold_token_types or (tok_type == tokenize.STRING and 'f' in tok_str[:tok_str.find(tok_str[-1])].lower()):
+            return False
+    return len(tokens) > 0
+
+def _fold_size(value):
+    """Lower bound of the length of the text of a constant value (counting nested items, unlike len())."""
+    # (sequences built while folding are kept within fold_max_size, so this stays cheap)
+    if isinstance(value, (compat.text_type, bytes)):
+        return len(value)
+    if isinstance(value, (tuple, list)):
+        return 2 + sum(_fold_size(item) + 1 for item in value)
+    return 1
+
+def _fold_value(node):
+    """Evaluate constant expression node, raising ValueError for anything else or results that could get too large."""
+    kind = type(node).__name__
+    if kind in _fold_literal_fields:
+        return getattr(node, _fold_literal_fields[kind])
+    if kind == 'Name' and node.id in _fold_names:
+        return _fold_names[node.id]
+    if kind in ('Tuple', 'List'):
+        values = [_fold_value(item) for item in node.elts]
+        if _fold_size(values) > fold_max_size:
+            raise ValueError('sequence too large')
+        return tuple(values) if kind == 'Tuple' else values
+    if kind == 'UnaryOp' and type(node.op).__name__ in _fold_unary_operators:
+        return _fold_unary_operators[type(node.op).__name__](_fold_value(node.operand))
+    if kind == 'BinOp' and type(node.op).__name__ in _fold_binary_operators:
+        op = type(node.op).__name__
+        left, right = _fold_value(node.left), _fold_value(node.right)
+        # check sizes before evaluating, e.g. '-' * 10**9, [[[0]*99]*99]*99 or 9**9**9
+        max_bits = fold_max_size * 4
+        if op == 'Mult' and isinstance(left, compat.integer_types) and isinstance(right, _fold_sequence_types):
+            left, right = right, left
+        if op == 'Mult' and isinstance(left, _fold_sequence_types) and isinstance(right, compat.integer_types) and _fold_size(left) * right > fold_max_size:
+            raise ValueError('sequence too large')
+        if op == 'Add' and isinstance(left, _fold_sequence_types) and isinstance(right, _fold_sequence_types) and _fold_size(left) + _fold_size(right) > fold_max_size:
+            raise ValueError('sequence too large')
+        if op == 'Mult' and isinstance(left, compat.integer_types) and isinstance(right, compat.integer_types) and left.bit_length() + right.bit_length() > max_bits:
+            raise ValueError('integer too large')
+        if op == 'Pow' and isinstance(left, compat.integer_types) and isinstance(right, compat.integer_types) and right > 0 and left.bit_length() * right > max_bits:
+            raise ValueError('integer too large')
+        if op == 'Mod' and isinstance(left, (compat.text_type, bytes)):
+            raise ValueError('string formatting') # e.g. '%*d' % (10**9, 0)
+        return _fold_binary_operators[op](left, right)
+    raise ValueError('not a constant expression')
+
+def fold_constant_field(expr, suffix, tokens):
+    """Text of a constant expression with its conversion and format spec (see split_field()), 
+    if it can safely be evaluated when pre-processing; None otherwise."""
+    # "'-' * 3", '', [..] -> '---'; '1024*1024', ':,', [..] -> '1,048,576'; 'x', '', [..] -> None
+    if not _is_constant_expression(tokens):
+        return None
+    conversion, spec = _re_field_suffix.match(suffix).groups()
+    spec = spec or u''
+    if '{' in spec or any(int(digits) > fold_max_size for digits in re.findall(r'\d+', spec)):
+        return None # nested replacement fields, or e.g. a huge width
+    try:
+        value = _fold_value(ast.parse(expr.strip(), mode='eval').body)
+        if conversion:
+            value = _fold_conversions[conversion](value)
+        text = format(value, spec) if spec or conversion else compat.text_type(value)
+        text.encode('utf-8' if sys.version_info.major >= 3 else 'ascii') # e.g. not lone surrogates
+    except Exception:
+        return None # left for run-time, e.g. 1/0 raises as usual
+    return text if len(text) <= fold_max_size else None
+
+def _fold_constant_fields(parts, exprs):
+    """Copy of parts and expression tokens (see preprocess_parts()), with the text of 
+    constant expressions (see fold_constant_field()) inlined into the text parts."""
+    # ['pre', "'-' * 3", 'post'] -> ['pre---post']
+    folded_parts = [parts[0]]
+    folded_exprs = []
+    for i in range(1, len(parts), 2):
+        expr, suffix = split_field(parts[i])
+        text = fold_constant_field(expr, suffix, exprs[i//2])
+        if text is not None:
+            folded_parts[-1] += escape_literal_text(text) + parts[i+1]
+        else:
+            folded_parts += [parts[i], parts[i+1]]
+            folded_exprs.append(exprs[i//2])
+    return folded_parts, folded_exprs
+
+def concatenation_operands(quotes, parts, exprs):
+    """List operands of string concatenation expression for text and expression parts (see split_string()), 
+    and expression tokens (see tokenize_expression()). Each operand is either string literal text, 
+    or a tuple of expression text, tokens and whether the expression needs str() conversion."""
+    # '"', ['pre', 'foo', '', "'bar'", 'post'] -> ['"pre"', ('foo', [..], True), ("'bar'", [..], False), '"post"']
     #
-    # However this avoids an issue where strings are concatenated without a + operator, e.g.
+    # Compared to simply concatenating all parts, e.g. 
+    #   '"#{foo}#{foo}"' -> '(""+str(foo)+""+str(foo)+"")'
+    # this drops empty string literals, and merges text parts around empty expressions (str() is '').
+    # 
+    # Note the brackets that format_concatenation() adds around the operands; these avoid an 
+    # issue where strings are concatenated without a + operator, e.g.
     # "#{foobar}" "#{foobar}" -> generates two string tokens
-    # ""+str(foobar)+"" ""+str(foobar)+"" -> OK
-    # str(foobar) str(foobar) -> NG
+    # (str(foobar)) (str(foobar)) -> NG (call)
+    # (str(foobar))+(str(foobar)) -> OK (see tokenize_and_preprocess())
     #
-    # The superfluous empty string concatenation may add *some* run-time overhead, but this should 
-    # be negligible.
-
-    s_out = '(' + s_out + ')' # add brackets so we can combine python string interpolation with interpy string interpolation
+    # Expressions with a conversion or format spec are formatted by format_field(), which 
+    # already results in text, e.g. '#{x:.3f}' -> 'format(x, ".3f")'.
+    operands = []
+    text = parts[0]
+    for i in range(1, len(parts), 2):
+        (expr, suffix), tokens = split_field(parts[i]), exprs[i//2]
+        if len(tokens) == 0:
+            text += parts[i+1] # empty expression
+            continue
+        if text:
+            operands.append(quotes + text + quotes)
+        if _has_toplevel_comma(tokens):
+            expr, tokens = _parenthesize_expression(expr, tokens) # tuple, not multiple arguments of str()
+        if suffix:
+            expr = format_field(quotes, expr, suffix)
+            operands.append((expr, tokenize_expression(expr), False))
+        else:
+            operands.append((expr, tokens, not _is_text_literal(tokens)))
+        text = parts[i+1]
+    if text or len(operands) == 0:
+        operands.append(quotes + text + quotes)
+    return operands
 
-    return s_out
+def format_concatenation(operands):
+    """Build string concatenation expression from operands (see concatenation_operands())."""
+    # ['"pre"', ('foo', [..], True), '"post"'] -> '("pre"+str(foo)+"post")'
+    s_out = ['('] # add brackets so we can combine python string interpolation with interpy string interpolation
+    for operand in operands:
+        if len(s_out) > 1:
+            s_out.append('+')
+        if isinstance(operand, tuple):
+            expr, tokens, convert = operand
+            s_out += [compat.text_type_str, '(', expr, ')'] if convert else [expr]
+        else:
+            s_out.append(operand)
+    s_out.append(')')
+    return ''.join(s_out)
 
-def interpolate_string_and_tokenize(s, start, end):
+def preprocess_string(s):
+    """Replace #{..} tags in double quoted string literal. Returns the text of a single 
+    replacement string token, or operands of a string concatenation expression (see concatenation_operands())."""
     #print('INTERPOLATING "%s"' % s.__repr__()) # XXX: debug
-    s_out = interpolate_string(s)
+    quotes, parts = split_string(s)
+    return _preprocess_split(s, quotes, parts)
 
-    s_srow, s_scol = start
-    s_erow, s_ecol = end
+def preprocess_string_group(literals):
+    """Like preprocess_string() for each of a group of implicitly concatenated double quoted 
+    string literals, but evaluating repeated expressions only once (see memoize).
 
-    # tokenize preprocessed string
+    Returns the replacements, and the expressions to pass as arguments to a function of the 
+    replacements (see memo_function_prefix()); [] if no expressions are memoized (plain replacements)."""
+    # ['"#{a[0]}/#{a[0]}"', '"#{b}"'] -> (['f"{_interpy_m0}/{_interpy_m0}"', 'f"{_interpy_m1}"'], ['a[0]', 'b'])
+    splits = [split_string(s) for s in literals]
     try:
-        stream = BytesIO(s_out.encode('utf-8'))
-        tokens = compat.tokenize(stream.readline)
-        tokens = list(tokens)
-    except tokenize.TokenError:
-        # probably invalid markup inside string, just return unprocessed string token
+        memoized = _memoize_group(splits)
+    except (tokenize.TokenError, SyntaxError):
+        memoized = None # reported when pre-processing the literals on their own
+    if memoized is None:
+        return [_preprocess_split(s, quotes, parts) for s, (quotes, parts) in zip(literals, splits)], []
+    group_parts, args = memoized
+    return [_preprocess_split(s, quotes, parts) for s, (quotes, _), parts in zip(literals, splits, group_parts)], args
+
+def _preprocess_split(s, quotes, parts):
+    if len(parts) == 1:
+        return s # nothing to interpolate
+
+    try:
+        return preprocess_parts(quotes, parts)
+    except (tokenize.TokenError, SyntaxError):
+        # probably invalid markup inside string, just return unprocessed string
         print('Warning: Unhandled exception tokenizing interpy interpolated string; invalid markup inside string?')
-        tokens = [compat.TokenInfo(tokenize.STRING, s, (s_srow, s_scol), (s_erow, s_ecol), s)]
-        return tokens, 0
+        return s
+
+def preprocess_parts(quotes, parts, fstring=True):
+    """Interpolate text and expression parts (see split_string()). Returns the text of a single 
+    f-string literal, or operands of a string concatenation expression (see concatenation_operands());
+    raises TokenError or SyntaxError if an expression can't be tokenized.
     
-    # strip initial ENCODING token (it is already in the parent token stream)
-    if hasattr(tokenize, 'ENCODING') and tokens[0][0] == tokenize.ENCODING: # Py2 doesn't generate initial ENCODING token
-        tokens = tokens[1:]
-
-    # strip final ENDMARKER token (because it terminates untokenize)
-    if tokens[-1][0] == tokenize.ENDMARKER:
-        tokens = tokens[:-1]
-
-    # fix row and column offsets to match those of outer token stream
-    tokens_fixed = []
-    for tok in tokens:
-        tok_type, tok_str, (srow, scol), (erow, ecol), tok_line = tok
-        
-        row1 = tokens[0][2][0] # row index of first line
-        assert row1 == 1 # assume row indexes start at 1, with 0 reserved for the ENCODING token
-
-        # first line continues outer token stream line
-        # following lines start at col 0
-        scoloff = s_scol if srow == row1 else 0
-        ecoloff = s_scol if erow == row1 else 0
-        tokens_fixed.append(compat.TokenInfo(tok_type, tok_str, (srow - row1 + s_srow, scol + scoloff), (erow - row1 + s_srow, ecol + ecoloff), tok_line))
-
-    if len(tokens_fixed) == 0:
-        col_offset = 0
+    The text of constant expressions is inlined (see fold_constant_field()), which may leave 
+    a plain string literal."""
+    # tokenize all expressions before generating anything, 
+    # so the caller can still fall back to the unprocessed string
+    exprs = [tokenize_expression(split_field(parts[i])[0]) for i in range(1, len(parts), 2)]
+    if fold_max_size > 0 and any(_is_constant_expression(tokens) for tokens in exprs):
+        parts, exprs = _fold_constant_fields(parts, exprs)
+        if len(parts) == 1:
+            return quotes + parts[0] + quotes
+
+    # single f-string token, if possible (Py3.6+); 
+    # compiles to a single BUILD_STRING, and doesn't depend on the 'str' name
+    if fstring:
+        s_out = format_fstring(quotes, parts)
+        if s_out is not None:
+            return s_out
+
+    return concatenation_operands(quotes, parts, exprs)
+
+_memo_name = '_interpy_m%d'
+_memo_constants = frozenset(['True', 'False', 'None'])
+
+def _is_memoizable(tokens):
+    """Check if expression may be memoized; with 'safe' memoization, only names and subscripts 
+    (with names, constants and slices as index) are, which don't have side effects."""
+    if memoize == 'all':
+        return len(tokens) > 0
+    prev = None
+    for tok_type, tok_str, scol, ecol in tokens:
+        if tok_type == tokenize.NAME:
+            if keyword.iskeyword(tok_str) and tok_str not in _memo_constants:
+                return False # e.g. 'x if y else z', 'not x', 'lambda: x'
+        elif tok_type == tokenize.OP:
+            if tok_str not in ('[', ']', ',', ':') and not (tok_str == '-' and prev in ('[', ',', ':')):
+                return False # operators and calls may have side effects
+        elif tok_type not in (tokenize.NUMBER, tokenize.STRING):
+            return False
+        prev = tok_str
+    return len(tokens) > 0 and tokens[0][0] == tokenize.NAME
+
+def _memo_argument(expr, tokens):
+    """Expression as an argument of a call."""
+    # e.g. 'a, b' (a tuple) or 'yield x' need brackets, 'a[0]' doesn't
+    depth = 0
+    for tok_type, tok_str, scol, ecol in tokens:
+        if tok_type == tokenize.OP and tok_str in '([{)]}':
+            depth += 1 if tok_str in '([{' else -1
+        elif depth == 0 and ((tok_type == tokenize.OP and tok_str == ',') or (tok_type == tokenize.NAME and tok_str == 'yield')):
+            return u'(%s)' % expr
+    return expr
+
+def _memoize_group(splits):
+    """Parts of each split literal of a group (see split_string()), with their expressions replaced 
+    by parameter names, and the expressions to pass as arguments (evaluating memoizable repeated 
+    expressions once, in the order of the expressions); None if no expression would be memoized."""
+    # all expressions are arguments, so they're still evaluated in the enclosing scope (e.g. a class 
+    # body, which a function doesn't see; or with yield or await); only literals are left to the function
+    fields = []
+    for k, (quotes, parts) in enumerate(splits):
+        for i in range(1, len(parts), 2):
+            expr, suffix = split_field(parts[i])
+            if '{' in suffix:
+                return None # nested replacement fields would be evaluated in the function
+            fields.append((k, i, expr, suffix, tokenize_expression(expr)))
+    counts = {}
+    for k, i, expr, suffix, tokens in fields:
+        counts[expr] = counts.get(expr, 0) + 1
+    # (a name is as cheap to evaluate again as to pass on)
+    memoized = set(expr for k, i, expr, suffix, tokens in fields if counts[expr] > 1 and _is_memoizable(tokens))
+    if not any(len(tokens) > 1 for k, i, expr, suffix, tokens in fields if expr in memoized):
+        return None
+
+    group_parts = [list(parts) for quotes, parts in splits]
+    names = {}
+    args = []
+    for k, i, expr, suffix, tokens in fields:
+        if _is_constant_expression(tokens):
+            continue # folded, or left to the function
+        name = names.get(expr)
+        if name is None:
+            name = _memo_name % len(args)
+            args.append(_memo_argument(expr, tokens))
+            if expr in memoized:
+                names[expr] = name
+        group_parts[k][i] = name + suffix
+    return group_parts, args
+
+def memo_function_prefix(n):
+    """Text of the start of a function of a group of literals with n memoized arguments (see preprocess_string_group())."""
+    # the literals follow, then ')(' + the arguments + ')'
+    return u'(lambda %s:' % u','.join(_memo_name % i for i in range(n))
+
+def interpolate_string(s):
+    """Replace #{..} tags in string literal with interpolation expressions (text form of interpolate_string_and_tokenize())."""
+    s_out = preprocess_string(s)
+    if isinstance(s_out, list):
+        s_out = format_concatenation(s_out)
+    return s_out
+
+def preprocess_bytes_string(s):
+    """Replace #{..} tags in double quoted bytes literal. Returns the literal itself if there is nothing
+    to interpolate, or operands of a bytes join expression (see format_bytes_join())."""
+    # 'b"pre#{foo}post"' -> ['b"pre"', ('foo', [..], False), 'b"post"']
+    prefix = s[0]
+    quotes, parts = split_string(s[1:])
+    if len(parts) == 1:
+        return s # nothing to interpolate
+
+    try:
+        exprs = [tokenize_expression(parts[i]) for i in range(1, len(parts), 2)]
+    except (tokenize.TokenError, SyntaxError):
+        print('Warning: Unhandled exception tokenizing interpy interpolated string; invalid markup inside string?')
+        return s
+
+    # expressions are joined as they are (bytes-like objects, no conversion)
+    operands = []
+    for i in range(0, len(parts), 2):
+        if parts[i]:
+            operands.append(prefix + quotes + parts[i] + quotes)
+        if i + 1 < len(parts) and exprs[i//2]:
+            expr, tokens = parts[i+1], exprs[i//2]
+            if _has_toplevel_comma(tokens):
+                expr, tokens = _parenthesize_expression(expr, tokens) # tuple, not multiple items
+            operands.append((expr, tokens, False))
+    return operands
+
+def format_bytes_join(operands):
+    """Build bytes join expression from operands (see preprocess_bytes_string())."""
+    # ['b"pre"', ('foo', [..], False), 'b"post"'] -> 'b"".join([b"pre",foo,b"post"])'
+    # (join copies each bytes-like operand, including bytearray and memoryview, once into the result)
+    return u'b"".join([' + u','.join(operand[0] if isinstance(operand, tuple) else operand for operand in operands) + u'])'
+
+def interpolate_bytes_string(s):
+    """Replace #{..} tags in bytes literal with a bytes join expression (text form)."""
+    s_out = preprocess_bytes_string(s)
+    if isinstance(s_out, list):
+        s_out = format_bytes_join(s_out)
+    return s_out
+
+# tokens of the expression tokenizer which are not part of the expression itself
+_expression_skip_types = frozenset(getattr(tokenize, name) for name in ['ENCODING', 'INDENT', 'DEDENT', 'NEWLINE', 'ENDMARKER'] if hasattr(tokenize, name))
+
+def tokenize_expression(expr):
+    """Tokenize interpolation expression, returning its (type, string, start column, end column) tuples."""
+    # (expressions never span multiple lines, see find_interpolations())
+    stream = BytesIO(expr.encode('utf-8'))
+    tokens = []
+    for tok_type, tok_str, (srow, scol), (erow, ecol), tok_line in compat.tokenize(stream.readline):
+        if tok_type in _expression_skip_types:
+            continue
+        if tok_type == tokenize.COMMENT or tok_type == tokenize.NL:
+            # e.g. nested '#{': would comment out the remainder of the interpolation
+            raise tokenize.TokenError('comment inside interpolation', (srow, scol))
+        tokens.append((tok_type, tok_str, scol, ecol))
+    return tokens
+
+def _advance(row, col, text):
+    """Position after text starting at (row, col)."""
+    nl = text.count('\n')
+    if nl == 0:
+        return row, col + len(text)
+    return row + nl, len(text) - text.rfind('\n') - 1
+
+def interpolate_string_and_tokenize(s, start, end, line=u''):
+    """Replace #{..} tags in string literal with interpolation expression tokens, 
+    positioned to continue the outer token stream at start. 
+
+    Returns an iterable of tokens, and the column offset of end caused by 
+    inserted characters (pre-processing never adds rows)."""
+    return tokenize_replacement(preprocess_string(s), start, end, line)
+
+def tokenize_replacement(replacement, start, end, line=u''):
+    """Tokenize result of preprocess_string(), see interpolate_string_and_tokenize()."""
+    if isinstance(replacement, list):
+        erow, ecol = _advance(start[0], start[1], format_concatenation(replacement))
+        tokens = _generate_concatenation_tokens(replacement, start, line)
     else:
-        tok_type, tok_str, (srow, scol), (erow, ecol), tok_line = tokens_fixed[-1] # last token
-        col_offset = ecol - s_ecol # column offset from pre-processing inserted characters
-        # (pre-processing never adds rows, so row_offset = 0 always)
-    
-    return tokens_fixed, col_offset
+        erow, ecol = _advance(start[0], start[1], replacement)
+        tokens = [(tokenize.STRING, replacement, start, (erow, ecol), line)]
+    assert erow == end[0]
+    return tokens, ecol - end[1]
+
+def tokenize_bytes_replacement(replacement, start, end, line=u''):
+    """Tokenize result of preprocess_bytes_string() (see tokenize_replacement())."""
+    if not isinstance(replacement, list):
+        return tokenize_replacement(replacement, start, end, line)
+    erow, ecol = _advance(start[0], start[1], format_bytes_join(replacement))
+    assert erow == end[0]
+    return _generate_bytes_join_tokens(replacement, start, line), ecol - end[1]
+
+def _generate_bytes_join_tokens(operands, start, line):
+    """Generate tokens of b"".join([operand,operand,..]), see format_bytes_join()."""
+    OP = tokenize.OP
+    row, col = start
+    for tok_type, tok_str in [(tokenize.STRING, u'b""'), (OP, u'.'), (tokenize.NAME, u'join'), (OP, u'('), (OP, u'[')]:
+        yield (tok_type, tok_str, (row, col), (row, col+len(tok_str)), line)
+        col += len(tok_str)
+    for i, operand in enumerate(operands):
+        if i > 0:
+            yield (OP, u',', (row, col), (row, col+1), line)
+            col += 1
+        if isinstance(operand, tuple):
+            expr, tokens, convert = operand
+            for tok_type, tok_str, scol, ecol in tokens:
+                yield (tok_type, tok_str, (row, col+scol), (row, col+ecol), line)
+            col += len(expr)
+        else:
+            erow, ecol = _advance(row, col, operand)
+            yield (tokenize.STRING, operand, (row, col), (erow, ecol), line)
+            row, col = erow, ecol
+    yield (OP, u']', (row, col), (row, col+1), line)
+    yield (OP, u')', (row, col+1), (row, col+2), line)
+
+def _generate_concatenation_tokens(operands, start, line):
+    """Generate tokens of (operand+operand+..), see format_concatenation()."""
+    OP = tokenize.OP
+    row, col = start
+    yield (OP, u'(', (row, col), (row, col+1), line)
+    col += 1
+    for i, operand in enumerate(operands):
+        if i > 0:
+            yield (OP, u'+', (row, col), (row, col+1), line)
+            col += 1
+
+        if isinstance(operand, tuple):
+            # interpolation expression
+            expr, tokens, convert = operand
+            if convert:
+                yield (tokenize.NAME, compat.text_type_str, (row, col), (row, col+len(compat.text_type_str)), line)
+                col += len(compat.text_type_str)
+                yield (OP, u'(', (row, col), (row, col+1), line)
+                col += 1
+            for tok_type, tok_str, scol, ecol in tokens:
+                yield (tok_type, tok_str, (row, col+scol), (row, col+ecol), line)
+            col += len(expr)
+            if convert:
+                yield (OP, u')', (row, col), (row, col+1), line)
+                col += 1
+        else:
+            # string literal text
+            erow, ecol = _advance(row, col, operand)
+            yield (tokenize.STRING, operand, (row, col), (erow, ecol), line)
+            row, col = erow, ecol
+
+    yield (OP, u')', (row, col), (row, col+1), line)
+
+_re_stag_bytes  = re.compile(br'#\{')
+_re_quote_bytes = re.compile(br'"')
+_re_lazy_bytes  = re.compile(br'L"')
+
+def may_interpolate(data):
+    """Cheap check whether bytes string may contain interpolations (or lazy string literals); 
+    if not, pre-processing can be skipped."""
+    # an interpolation requires an opening tag inside a double quoted string literal, 
+    # so a source without any '#{' (or without any '"') certainly has none; a lazy literal
+    # needs its marker removed even without interpolations (L"plain" -> "plain")
+    # (using regular expressions, because unlike 'in' these also scan memoryviews without copying;
+    # separately, as a single pattern with alternatives is much slower to scan with)
+    return (_re_stag_bytes.search(data) is not None and _re_quote_bytes.search(data) is not None) or _re_lazy_bytes.search(data) is not None
 
 def is_double_quoted(s):
     """Check if string is non-raw single quoted with double quotes."""
@@ -139,6 +691,14 @@ def is_double_quoted(s):
     # r'''foobar''' -> False
     return (len(s) >= 3 and s[0] == '"' and s[-1] == '"') or (len(s) >= 7 and s[0:3] == '"""' and s[-3:] == '"""')
 
+def is_double_quoted_bytes(s):
+    """Check if string is non-raw bytes literal with double quotes."""
+    # b"foobar"      -> True
+    # B"""foobar"""  -> True
+    # b'foobar'      -> False
+    # br"foobar"     -> False
+    return s[:1] in ('b', 'B') and is_double_quoted(s[1:])
+
 def is_docstring(cur_tok_type, cur_tok_str, cur_scol, prev_tok_type):
     """Check if token is docstring."""
     # check if triple quoted string
@@ -153,57 +713,254 @@ def is_docstring(cur_tok_type, cur_tok_str, cur_scol, prev_tok_type):
 #    return s.replace(r'\"', '"').replace(r'\'', '\'')
 
 def tokenize_and_preprocess(readline):
-    tokens = compat.tokenize(readline)
+    return preprocess_tokens(compat.tokenize(readline))
 
-    last_interp_row        = -1
-    last_interp_col_offset = 0
-    prev_tok_type          = None
-    pprev_tok_type         = None
-    while 1:
-        try:
-            token = next(tokens)
-        except StopIteration:
+def text_readline(text):
+    """readline() function returning lines of text, without copying all of it (like StringIO does)."""
+    pos = [0]
+    def readline():
+        start = pos[0]
+        end = text.find(u'\n', start) + 1 or len(text)
+        pos[0] = end
+        return text[start:end]
+    return readline
+
+def _tokenize_group_prefix(prefix):
+    """Tokenize the start of the function of a group of literals (lazy_prefix or memo_function_prefix())."""
+    tokens = _group_prefix_tokens.get(prefix)
+    if tokens is None:
+        tokens = _group_prefix_tokens[prefix] = tokenize_expression(prefix + u'0)')[:-2]
+    return tokens
+
+def _read_ahead_group(token, tokens, pending):
+    """Read ahead the rest of the group of implicitly concatenated literals starting with string token 
+    (appending the tokens read to pending); returns the tokens of the group: string, NL and COMMENT 
+    tokens, with lazy literals as string tokens starting at their marker, and the starts of those."""
+    group = [token]
+    lazy_starts = set()
+    for token_ahead in tokens:
+        pending.append(token_ahead)
+        if token_ahead[0] == tokenize.NAME and token_ahead[1] == lazy_marker:
+            marker, token_ahead = token_ahead, next(tokens, None)
+            if token_ahead is None:
+                break
+            pending.append(token_ahead)
+            if token_ahead[0] != tokenize.STRING or token_ahead[2] != marker[3] or not is_double_quoted(token_ahead[1]):
+                break
+            group.append((tokenize.STRING, token_ahead[1], marker[2], token_ahead[3], token_ahead[4]))
+            lazy_starts.add(marker[2])
+        elif token_ahead[0] in (tokenize.STRING, tokenize.NL, tokenize.COMMENT):
+            group.append(token_ahead)
+        else:
             break
+    return group, lazy_starts
+
+def tokenize_and_preprocess_text(text):
+    """Like tokenize_and_preprocess(), but of source text instead of bytes."""
+    return preprocess_tokens(compat.generate_tokens(text_readline(text)))
+
+def preprocess_tokens(tokens, record=None, source_map=None):
+    """Pre-process tokens (of tokenize.tokenize()), generates output tokens; 
+    counts interpolated string literals in optional record dict (see instrument.py), 
+    and adds column shifts to optional SourceMap (see sourcemap.py).
+
+    Input tokens whose position doesn't change are passed on as is; others, and inserted 
+    tokens, are plain (type, string, start, end, line) tuples, which untokenize() accepts
+    as well (constructing TokenInfo named tuples is several times slower)."""
+    tokens = iter(tokens)
+    memoizing = bool(memoize)
+
+    last_row                 = -1
+    last_col_offset          = 0
+    prev_tok_type            = None
+    prev_code_tok_type       = None     # (skipping NL and COMMENT tokens)
+    prev_str_is_expression   = False
+    pending                  = deque()  # tokens read ahead
+    group_replacements       = None     # replacements of the rest of a group of literals (when memoizing)
+    group_call               = None     # end of the function of that group: start of its last literal, and text of the call
+    while 1:
+        if pending:
+            token = pending.popleft()
+        else:
+            try:
+                token = next(tokens)
+            except StopIteration:
+                break
+
+        lazy = False
+        if token[0] == tokenize.NAME and token[1] == lazy_marker:
+            # lazy string literal marker directly followed by double quoted string; 
+            # continue with a string token starting at the marker
+            if pending:
+                token_ahead = pending.popleft()
+            else:
+                token_ahead = next(tokens, None)
+            if token_ahead is not None and token_ahead[0] == tokenize.STRING and token_ahead[2] == token[3] and is_double_quoted(token_ahead[1]):
+                token = (tokenize.STRING, token_ahead[1], token[2], token_ahead[3], token_ahead[4])
+                lazy = True
+            elif token_ahead is not None:
+                pending.appendleft(token_ahead)
 
         tok_type, tok_str, (srow, scol), (erow, ecol), tok_line = token
-        if srow == last_interp_row:
-            # token on same line as last interpolation, 
-            # so token after interpolated tokens; shift columns
-            col_offset = last_interp_col_offset
+        scol_in, ecol_in = scol, ecol
+        if srow == last_row:
+            # token on same line as end of previous token, 
+            # so possibly after interpolated tokens; shift columns
+            col_offset = last_col_offset
         else:
             # no interpolation previous to token on same line
             col_offset = 0
-            last_interp_col_offset = 0 # new line, so reset interpolation column offset
 
         scol += col_offset
         if srow == erow: # single line token, also offset end column
             ecol += col_offset
 
-        is_possible_interp_str = tok_type == tokenize.STRING and is_double_quoted(tok_str) and not is_docstring(tok_type, tok_str, scol, prev_tok_type)
-        
-        if is_possible_interp_str and (prev_tok_type == tokenize.STRING or (prev_tok_type == tokenize.NL and pprev_tok_type == tokenize.STRING)):
-            # current token is string and previous token is string (or string on new line); means 
-            # these two strings are concatenated without explicit '+';
-            # we add '+' here because pre-procesing may add parenthesis
-            token_interp = compat.TokenInfo(tokenize.OP, u'+', (srow, scol), (srow, scol+1), tok_line)
-            #print('a:'+str(token_interp)) # XXX: DEBUG
-            yield token_interp
-            scol += 1
-            if srow == erow: # single line token, also offset end column
-                ecol += 1
-            last_interp_col_offset += 1
-
-        pprev_tok_type = prev_tok_type
+        is_possible_interp_str = tok_type == tokenize.STRING and is_double_quoted(tok_str) and (lazy or not is_docstring(tok_type, tok_str, scol, prev_tok_type))
+        is_possible_interp_bytes = tok_type == tokenize.STRING and not is_possible_interp_str and is_double_quoted_bytes(tok_str)
+
+        if tok_type == tokenize.STRING and prev_code_tok_type != tokenize.STRING:
+            # read ahead the rest of the group of implicitly concatenated literals, 
+            # and pre-process the literals together
+            group, lazy_starts = _read_ahead_group(token, tokens, pending)
+            if lazy:
+                lazy_starts.add(token[2])
+            literals = []
+            group_prev_tok_type = prev_tok_type
+            for t in group:
+                if t[0] == tokenize.STRING and is_double_quoted(t[1]) and (t[2] in lazy_starts or not is_docstring(t[0], t[1], t[2][1], group_prev_tok_type)):
+                    literals.append(t)
+                group_prev_tok_type = t[0]
+            group_replacements = {}
+            prefix = None
+            if lazy_starts:
+                # a lazy literal makes the group the body of the function of a LazyString, 
+                # so all of it is rendered when needed: LazyString(lambda:"..#{x}.." "..")
+                group_replacements = dict((t[2], preprocess_string(t[1])) for t in literals)
+                if any(group_replacements[t[2]] is not t[1] for t in literals):
+                    prefix, call = lazy_prefix, u')'
+            elif memoizing and literals and not is_docstring(tok_type, tok_str, scol, prev_tok_type):
+                replacements, args = preprocess_string_group([t[1] for t in literals])
+                group_replacements = dict((t[2], replacement) for t, replacement in zip(literals, replacements))
+                if args:
+                    # the group becomes the body of a function, called with the expressions:
+                    # (lambda _interpy_m0,..:"..#{_interpy_m0}.." ..)(a[0],..)
+                    prefix, call = memo_function_prefix(len(args)), u')(%s)' % u','.join(args)
+            if prefix is not None:
+                for tok_type_p, tok_str_p, scol_p, ecol_p in _tokenize_group_prefix(prefix):
+                    yield (tok_type_p, tok_str_p, (srow, scol+scol_p), (srow, scol+ecol_p), tok_line)
+                scol += len(prefix)
+                if srow == erow: # single line token, also offset end column
+                    ecol += len(prefix)
+                col_offset += len(prefix)
+                group_call = ([t for t in group if t[0] == tokenize.STRING][-1][2], call)
+
+        if tok_type == tokenize.STRING:
+            if is_possible_interp_bytes:
+                replacement = preprocess_bytes_string(tok_str)
+            elif not is_possible_interp_str:
+                replacement = tok_str
+            elif group_replacements:
+                replacement = group_replacements.pop((srow, scol_in))
+            else:
+                replacement = preprocess_string(tok_str)
+            is_expression = isinstance(replacement, list)
+            if record is not None and replacement is not tok_str:
+                record['literals'] += 1
+
+            if (is_expression or prev_str_is_expression) and prev_code_tok_type == tokenize.STRING:
+                # current token is string and previous token is string (possibly on a previous line, after comments); means 
+                # these two strings are concatenated without explicit '+';
+                # we add '+' here because pre-procesing added parenthesis to one of them
+                # (adjacent single token strings, including f-strings, are still implicitly 
+                # concatenated, which the compiler merges into a single string constant or BUILD_STRING)
+                token_interp = (tokenize.OP, u'+', (srow, scol), (srow, scol+1), tok_line)
+                #print('a:'+str(token_interp)) # XXX: DEBUG
+                yield token_interp
+                scol += 1
+                if srow == erow: # single line token, also offset end column
+                    ecol += 1
+                    col_offset += 1
+            prev_str_is_expression = is_expression
+
         prev_tok_type = tok_type
+        if tok_type not in (tokenize.NL, tokenize.COMMENT):
+            prev_code_tok_type = tok_type
 
-        if is_possible_interp_str:
-            tokens_interp, interp_col_offset = interpolate_string_and_tokenize(tok_str, (srow, scol), (erow, ecol))
-            last_interp_row = erow
-            last_interp_col_offset += interp_col_offset # add for case of multiple interpolations on the same line
+        if source_map is not None and (scol != scol_in or is_possible_interp_str or is_possible_interp_bytes):
+            source_map.add(srow, scol, scol_in)
+
+        if is_possible_interp_bytes:
+            tokens_interp, interp_col_offset = tokenize_bytes_replacement(replacement, (srow, scol), (erow, ecol), tok_line)
+            for token_interp in tokens_interp:
+                yield token_interp
+        elif is_possible_interp_str:
+            tokens_interp, interp_col_offset = tokenize_replacement(replacement, (srow, scol), (erow, ecol), tok_line)
             for token_interp in tokens_interp:
                 #print('i:'+str(token_interp)) # XXX: DEBUG
                 yield token_interp
         else:
-            token_interp = compat.TokenInfo(tok_type, tok_str, (srow, scol), (erow, ecol), tok_line) # same as input token, but position possibly changed
-            #print('  '+str(token_interp)) # XXX: DEBUG
-            yield token_interp
\ No newline at end of file
+            if scol == scol_in and ecol == ecol_in:
+                yield token # position unchanged (most tokens), pass on as is
+            else:
+                yield (tok_type, tok_str, (srow, scol), (erow, ecol), tok_line) # same as input token, but shifted
+            interp_col_offset = 0
+
+        if group_call is not None and tok_type == tokenize.STRING and group_call[0] == (srow, scol_in):
+            # end (and call) the function of the group after its last literal
+            call = group_call[1]
+            col = ecol + interp_col_offset
+            if source_map is not None:
+                source_map.add(erow, col, ecol_in)
+            for tok_type_c, tok_str_c, scol_c, ecol_c in tokenize_expression(u'(0' + call)[2:]:
+                yield (tok_type_c, tok_str_c, (erow, col+scol_c-2), (erow, col+ecol_c-2), tok_line)
+            interp_col_offset += len(call)
+            group_call = None
+
+        # column offset of following tokens on the line this token ends on
+        # (for multi line tokens, the offset of the first line doesn't apply to the last line)
+        last_row = erow
+        last_col_offset = col_offset + interp_col_offset if srow == erow else interp_col_offset
+        if source_map is not None and (is_possible_interp_str or is_possible_interp_bytes):
+            source_map.add(erow, ecol_in + last_col_offset, ecol_in)
+
+def indentation_preamble(indents):
+    """Lines re-establishing given indentation levels (list of bytes strings, outermost first), 
+    to tokenize source starting at a statement in the middle of indented blocks."""
+    # starts with a line of code, so tokenize won't mistake an encoding cookie 
+    # on the first line(s) of the source that follows for its own
+    return b''.join(indent + b'if 1:\n' for indent in [b''] + indents)
+
+def find_last_statement_end(data, indents):
+    """Find end of last complete logical line (i.e. at a NEWLINE token, outside brackets and 
+    multi-line strings) in UTF-8 encoded bytes string, which starts at a statement with 
+    given indentation levels.
+
+    Returns offset of the end of that line (0 if there is no complete logical line yet), 
+    and indentation levels of the statement following it."""
+    end = data.rfind(b'\n') + 1     # only tokenize complete lines
+    if end == 0:
+        return 0, indents
+
+    preamble = indentation_preamble(indents)
+    preamble_rows = len(indents) + 1
+    stream = BytesIO(preamble + data[:end])
+    offsets = [0]                   # offsets of the ends of lines read
+    def readline():
+        line = stream.readline()
+        offsets.append(offsets[-1] + len(line))
+        return line
+
+    stack = []
+    statement_end, statement_indents = 0, indents
+    try:
+        for tok_type, tok_str, (srow, scol), _, _ in compat.tokenize(readline):
+            if tok_type == tokenize.INDENT:
+                stack.append(tok_str.encode('utf-8'))
+            elif tok_type == tokenize.DEDENT:
+                stack.pop()
+            elif tok_type == tokenize.NEWLINE and tok_str and srow > preamble_rows:
+                statement_end = offsets[srow] - len(preamble)
+                statement_indents = list(stack)
+    except (tokenize.TokenError, SyntaxError):
+        pass # incomplete statement at end (or invalid source; will be reported on final transform)
+    return statement_end, statement_indents
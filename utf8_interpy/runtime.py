@@ -0,0 +1,93 @@
+"""Run-time support for code generated by the pre-processor.
+
+Lazy string literals, marked with an 'L' directly in front of the opening quotes
+
+>>> log.debug(L"state=#{expensive_repr(obj)}")
+
+compile to LazyString(lambda: ..), which only evaluates the interpolations when the text is
+first needed, e.g. when a logging handler formats the message (not at all if the level is disabled).
+"""
+import sys
+
+class LazyString(object):
+    """Text which is rendered by calling a function when it's first converted to str, then cached.
+
+    Note that expressions are evaluated when rendering, so they see the values of variables
+    at that time, not at the time the LazyString was created. Like in a lambda, names defined 
+    in an enclosing class body aren't visible to them (NameError when rendering).
+
+    Other than that, it can be used like its text with operators and str methods, 
+    but it isn't a str itself, e.g. for isinstance(), str.join() or the re module."""
+
+    __slots__ = ('_render', '_text')
+
+    def __init__(self, render):
+        self._render = render
+        self._text = None
+
+    def __str__(self):
+        if self._text is None:
+            self._text = self._render()
+            self._render = None # release closure
+        return self._text
+
+    if sys.version_info.major < 3:
+        __unicode__ = __str__
+
+    def __repr__(self):
+        return repr(str(self))
+
+    def __format__(self, spec):
+        return format(str(self), spec)
+
+    def __getattr__(self, name):
+        # other str methods, e.g. upper(), encode()
+        return getattr(str(self), name)
+
+    def __len__(self):
+        return len(str(self))
+
+    def __eq__(self, other):
+        return str(self) == other
+
+    def __ne__(self, other):
+        return str(self) != other
+
+    def __hash__(self):
+        return hash(str(self))
+
+    def __add__(self, other):
+        return str(self) + other
+
+    def __radd__(self, other):
+        return other + str(self)
+
+    def __mod__(self, args):
+        return str(self) % args
+
+    def __mul__(self, n):
+        return str(self) * n
+
+    def __rmul__(self, n):
+        return n * str(self)
+
+    def __lt__(self, other):
+        return str(self) < other
+
+    def __le__(self, other):
+        return str(self) <= other
+
+    def __gt__(self, other):
+        return str(self) > other
+
+    def __ge__(self, other):
+        return str(self) >= other
+
+    def __contains__(self, s):
+        return s in str(self)
+
+    def __iter__(self):
+        return iter(str(self))
+
+    def __getitem__(self, key):
+        return str(self)[key]
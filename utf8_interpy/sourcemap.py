@@ -0,0 +1,91 @@
+"""Maps columns of pre-processed source back to columns of the original source.
+
+Pre-processing never changes line numbers, but interpolated string literals (and the
+'+' operators inserted between them) shift the columns of everything after them on the
+same line. Tracebacks, coverage and fine-grained error locations (Py3.11+) refer to
+columns of the pre-processed source; a SourceMap translates these back
+
+>>> source_map = utf8_interpy.sourcemap.load('foo.py')
+>>> source_map.original_position(row, col)
+"""
+from array import array
+from bisect import bisect_right
+
+class SourceMap(object):
+    """Per-line breakpoints, where the offset between transformed and original columns changes.
+
+    Breakpoints are stored in three flat arrays (row, transformed column, original column),
+    sorted by row and column, so lookups are O(log n) using bisection."""
+
+    typecode = 'i'
+
+    def __init__(self, rows=None, tcols=None, ocols=None):
+        self.rows = rows if rows is not None else array(self.typecode)
+        self.tcols = tcols if tcols is not None else array(self.typecode)
+        self.ocols = ocols if ocols is not None else array(self.typecode)
+        self._last_row = 0
+        self._last_delta = 0
+
+    def clear(self):
+        del self.rows[:], self.tcols[:], self.ocols[:]
+        self._last_row = 0
+        self._last_delta = 0
+
+    def add(self, row, tcol, ocol):
+        """Add breakpoint: from column tcol of transformed row on, columns correspond
+        to ocol and onwards in the original; must be added in order."""
+        if row != self._last_row:
+            self._last_row, self._last_delta = row, 0  # rows start without offset
+        delta = tcol - ocol
+        if delta != self._last_delta:
+            self.rows.append(row)
+            self.tcols.append(tcol)
+            self.ocols.append(ocol)
+            self._last_delta = delta
+
+    def original_column(self, row, col):
+        """Map column on (1-based) row of transformed source to column of original source."""
+        lo = bisect_right(self.rows, row - 1)
+        hi = bisect_right(self.rows, row, lo)
+        i = bisect_right(self.tcols, col, lo, hi) - 1
+        if i < lo:
+            return col  # before first breakpoint on row
+        ocol = self.ocols[i] + col - self.tcols[i]
+        if i + 1 < hi:
+            ocol = min(ocol, self.ocols[i + 1]) # e.g. inside an interpolated string, which got longer
+        return ocol
+
+    def original_position(self, row, col):
+        """Map (row, column) position of transformed source to position in original source."""
+        return row, self.original_column(row, col)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __eq__(self, other):
+        return isinstance(other, SourceMap) and (self.rows, self.tcols, self.ocols) == (other.rows, other.tcols, other.ocols)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def to_bytes(self):
+        """Serialize to bytes string (in native byte order, e.g. for the transform cache)."""
+        data = array(self.typecode, [len(self.rows)]) + self.rows + self.tcols + self.ocols
+        return data.tobytes() if hasattr(data, 'tobytes') else data.tostring()
+
+    @classmethod
+    def from_bytes(cls, data):
+        values = array(cls.typecode)
+        if hasattr(values, 'frombytes'):
+            values.frombytes(data)
+        else:
+            values.fromstring(data)
+        n = values[0]
+        return cls(values[1:1+n], values[1+n:1+2*n], values[1+2*n:1+3*n])
+
+
+def load(path):
+    """Source map of source file, from the transform cache if possible."""
+    from . import codec
+    with open(path, 'rb') as f:
+        return codec.transform_source_map(f.read())[1]
@@ -0,0 +1,174 @@
+"""Run-time interpolation of #{..} tags in template text, e.g. in a REPL or debugger
+
+>>> from utf8_interpy.template import interpolate
+>>> name = 'world'
+>>> interpolate('Hello #{name.title()}!')
+'Hello World!'
+
+To render the same template over many records, compile it once into a Template
+
+>>> t = Template('#{datdir}/feat/#{feat}_#{ndim[feat]}.npy')
+>>> for batch in t.render_many(rows):    # mappings with 'datdir' and 'feat' keys
+...     ...
+
+Templates are pre-processed like double quoted string literals in source code, and compiled
+into a code object which evaluates to the interpolated text. Code objects of the most recently
+used templates are kept, so repeated calls only evaluate the expressions (like an f-string would).
+"""
+from itertools import groupby, islice
+from keyword import iskeyword
+from operator import itemgetter
+import sys
+import tokenize
+import types
+from . import compat
+from . import preprocessor
+
+cache_size = 256     # number of compiled templates to keep
+
+def _split_template(template):
+    # like split_string(), but template text is escaped as text of a string literal
+    parts = []
+    pos = 0
+    for b, e in preprocessor.find_interpolations(template):
+        parts.append(preprocessor.escape_literal_text(template[pos:b]))
+        parts.append(template[b+2:e-1])
+        pos = e
+    parts.append(preprocessor.escape_literal_text(template[pos:]))
+    return parts
+
+def template_source(template):
+    """Expression source code which evaluates to the interpolated template text."""
+    # 'Hello #{name}!\n' -> 'f"Hello {name}!\x0a"'
+    parts = _split_template(template)
+
+    # unlike inside a string literal, expressions may contain any quotes
+    exprs = parts[1::2]
+    quotes = '"' if not any('"' in expr for expr in exprs) else "'"
+    fstring = compat.fstring_allows_backslash or not any(quotes in expr for expr in exprs)
+    try:
+        s_out = preprocessor.preprocess_parts(quotes, parts, fstring)
+    except tokenize.TokenError as e:
+        raise SyntaxError('invalid expression in template %r: %s' % (template, e.args[0]))
+    if isinstance(s_out, list):
+        s_out = preprocessor.format_concatenation(s_out)
+    return s_out
+
+def compile_template(template):
+    """Compile template text into a code object (see template_source()); raises SyntaxError for invalid expressions."""
+    return compile(template_source(template), '<template>', 'eval')
+
+compiled = compat.lru_cache(cache_size)(compile_template)
+
+def set_cache_size(max_items):
+    """Set number of compiled templates to keep (and clear the cache)."""
+    global cache_size, compiled
+    cache_size = max_items
+    compiled = compat.lru_cache(cache_size)(compile_template)
+
+def interpolate(template, globals=None, locals=None):
+    """Interpolate #{..} tags in template text; expressions are evaluated like eval() does,
+    in the namespaces of the caller by default."""
+    if globals is None:
+        frame = sys._getframe(1)
+        globals = frame.f_globals
+        if locals is None:
+            locals = frame.f_locals
+    return eval(compiled(template), globals, locals)
+
+def template_names(template):
+    """Names of variables used by the expressions in template text, in order of first use."""
+    # '#{a.b} #{f(a, x=c)}' -> ['a', 'f', 'x', 'c'] (also keyword argument names, which does no harm)
+    parts = _split_template(template)
+    names = []
+    for i in range(1, len(parts), 2):
+        try:
+            tokens = preprocessor.tokenize_expression(preprocessor.split_field(parts[i])[0])
+        except tokenize.TokenError:
+            continue # template_source() raises SyntaxError
+        prev = None
+        for tok_type, tok_str, scol, ecol in tokens:
+            if tok_type == tokenize.NAME and prev != '.' and not iskeyword(tok_str) and tok_str not in names:
+                names.append(tok_str)
+            prev = tok_str
+    return names
+
+class Template(object):
+    """Template text with #{..} tags, compiled once and then rendered for many records.
+
+    Names which are fields of the records are bound to local variables of a generated function
+    which renders a whole batch of records; all other names are looked up in globals (those of
+    the caller by default). Constant text between the tags is part of the compiled code, and
+    no namespace is built per record."""
+
+    batch_size = 1000
+
+    def __init__(self, text, globals=None):
+        if globals is None:
+            globals = sys._getframe(1).f_globals
+        self.text = text
+        self.globals = globals
+        self.source = template_source(text)
+        self.names = template_names(text)
+        self._code = compile(self.source, '<template>', 'eval')
+        self._renderers = {}
+
+    def __repr__(self):
+        return 'Template(%r)' % (self.text,)
+
+    def render(self, row=None, **fields):
+        """Render template for a single record (mapping), or for keyword arguments."""
+        return eval(self._code, self.globals, row if row is not None else fields)
+
+    def render_many(self, rows, batch_size=None):
+        """Render template for each record (mapping) of an iterable, generating lists 
+        of up to batch_size results; like render(), names are fields of each record."""
+        names = frozenset(self.names)
+        batch_size = batch_size or self.batch_size
+        rows = iter(rows)
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                return
+            # render runs of records with the same fields (usually the whole batch) together
+            results = []
+            for run_names, run in groupby(batch, names.intersection):
+                fields = tuple(name for name in self.names if name in run_names)
+                if fields:
+                    run = compat.imap(itemgetter(*fields), run) # single value, or tuple of values
+                results.extend(self._renderer(fields)(run))
+            yield results
+
+    def render_columns(self, columns, batch_size=None):
+        """Render template for each row of columns, a mapping of field names to sequences 
+        of equal length (e.g. lists or arrays), generating lists of up to batch_size results."""
+        fields = tuple(name for name in self.names if name in columns)
+        if len(fields) > 1:
+            rows = compat.izip(*[columns[name] for name in fields])
+        elif fields:
+            rows = iter(columns[fields[0]])
+        else:
+            rows = iter(range(len(next(iter(columns.values()))) if columns else 0))
+        return self._render_batches(fields, rows, batch_size)
+
+    def _render_batches(self, fields, rows, batch_size):
+        render_batch = self._renderer(fields)
+        batch_size = batch_size or self.batch_size
+        while True:
+            batch = render_batch(islice(rows, batch_size))
+            if not batch:
+                return
+            yield batch
+
+    def _renderer(self, fields):
+        # function rendering an iterable of field values (tuples, or single values), e.g.
+        #   def render_batch(_rows):
+        #       return [f"{datdir}/feat/{feat}" for datdir, feat in _rows]
+        render_batch = self._renderers.get(fields)
+        if render_batch is None:
+            target = ', '.join(fields) or '_utf8_interpy_row'
+            source = 'def render_batch(_utf8_interpy_rows):\n    return [%s for %s in _utf8_interpy_rows]\n' % (self.source, target)
+            code = compile(source, '<template>', 'exec')
+            code = [const for const in code.co_consts if isinstance(const, types.CodeType)][0]
+            render_batch = self._renderers[fields] = types.FunctionType(code, self.globals)
+        return render_batch